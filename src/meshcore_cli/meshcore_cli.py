@@ -4,12 +4,10 @@
 """
 import asyncio
 import os, sys
-import time, datetime
+import time
 import getopt, json, shlex, re
 import logging
-import requests
 from bleak import BleakScanner, BleakClient
-import serial.tools.list_ports
 from pathlib import Path
 import traceback
 from prompt_toolkit.shortcuts import PromptSession
@@ -22,6 +20,12 @@ from prompt_toolkit.shortcuts import radiolist_dialog
 
 from meshcore import MeshCore, EventType, logger
 
+# orjson is optional, used for faster json output when available
+try :
+    import orjson
+except ImportError :
+    orjson = None
+
 # Version
 VERSION = "v1.1.39"
 
@@ -31,6 +35,9 @@ MCCLI_ADDRESS = MCCLI_CONFIG_DIR + "default_address"
 MCCLI_HISTORY_FILE = MCCLI_CONFIG_DIR + "history"
 MCCLI_INIT_SCRIPT = MCCLI_CONFIG_DIR + "init"
 
+# contacts uploaded with upload_contact/upload_card are posted there
+MAP_NODES_URL = "https://map.meshcore.dev/api/v1/nodes"
+
 # Fallback address if config file not found
 # if None or "" then a scan is performed
 ADDRESS = ""
@@ -65,46 +72,159 @@ ANSI_BORANGE="\033[1;38;5;214m"
 ANSI_YELLOW = "\033[0;33m"
 ANSI_BYELLOW = "\033[1;33m"
 
-def escape_ansi(line):
-    ansi_escape = re.compile(r'(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]')
-    return ansi_escape.sub('', line)
+# matches ansi escape sequences, used to strip colors
+ANSI_ESCAPE = re.compile(r'(?:\x1B[@-_]|[\x80-\x9F])[0-?]*[ -/]*[@-~]')
+
+def json_default(obj):
+    """ bytes (acks, keys) are dumped as hex strings """
+    if isinstance(obj, (bytes, bytearray)) :
+        return obj.hex()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# json.dumps builds a new encoder for each call when given options
+JSON_INDENT_ENCODER = json.JSONEncoder(indent=4, default=json_default)
+# same output as orjson : utf-8 kept as is, non str keys converted
+JSON_COMPACT_ENCODER = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False, default=json_default)
+
+def dump_json(obj, indent=False):
+    """ compact json for machine output, indented for display """
+    if indent :
+        return JSON_INDENT_ENCODER.encode(obj)
+    if orjson is None :
+        return JSON_COMPACT_ENCODER.encode(obj)
+    return orjson.dumps(obj, default=json_default, option=orjson.OPT_NON_STR_KEYS).decode()
+
+def print_json(obj, indent=False):
+    print(dump_json(obj, indent))
+
+def split_args(line):
+    """ splits a command line, only using shlex when there are quotes or escapes """
+    if '"' in line or "'" in line or "\\" in line :
+        return shlex.split(line)
+    return line.split()
+
+def split_params(param, nb, conv=str):
+    """ splits a comma separated parameter, raises IndexError if it has not nb fields """
+    params = param.split(",")
+    if len(params) != nb :
+        raise IndexError(f"expected {nb} values, got {len(params)}")
+    return [conv(p) for p in params]
 
-def print_one_line_above(str):
+def escape_ansi(line):
+    if line.isascii() and not "\x1B" in line : # nothing to strip
+        return line
+    return ANSI_ESCAPE.sub('', line)
+
+# terminal width is only queried again after this delay (in seconds)
+TERMINAL_WIDTH_TTL = 1
+
+def terminal_width():
+    """ columns of the terminal, cached for TERMINAL_WIDTH_TTL """
+    now = time.monotonic()
+    if now >= terminal_width.fresh_until :
+        terminal_width.columns = os.get_terminal_size().columns
+        terminal_width.fresh_until = now + TERMINAL_WIDTH_TTL
+    return terminal_width.columns
+terminal_width.columns = 80
+terminal_width.fresh_until = 0
+
+def print_one_line_above(line):
     """ prints a string above current line """
-    width = os.get_terminal_size().columns
-    stringlen = len(escape_ansi(str))-1
-    lines = divmod(stringlen, width)[0] + 1
-    print("\u001B[s", end="")                   # Save current cursor position
-    print("\u001B[A", end="")                   # Move cursor up one line
-    print("\u001B[999D", end="")                # Move cursor to beginning of line
-    for _ in range(lines):
-        print("\u001B[S", end="")                   # Scroll up/pan window down 1 line
-        print("\u001B[L", end="")                   # Insert new line
-    for _ in range(lines - 1):
-        print("\u001B[A", end="")                   # Move cursor up one line
-    print(str, end="")                          # Print output status msg
-    print("\u001B[u", end="", flush=True)       # Jump back to saved cursor position
-
-def print_above(str):
-    lines = str.split('\n')
-    for l in lines:
+    width = terminal_width()
+    lines = -(-len(escape_ansi(line)) // width) # ceil, 0 for an empty line
+    sys.stdout.write("\u001B[s"                 # Save current cursor position
+                   + "\u001B[A"                 # Move cursor up one line
+                   + "\u001B[999D"              # Move cursor to beginning of line
+                   + "\u001B[S\u001B[L" * lines # Scroll up/pan window down 1 line, insert new line
+                   + "\u001B[A" * (lines - 1)   # Move cursor up one line
+                   + line                       # Print output status msg
+                   + "\u001B[u")                # Jump back to saved cursor position
+    sys.stdout.flush()
+
+def print_above(text):
+    for l in text.split('\n'):
         print_one_line_above(l)
 
-async def process_event_message(mc, ev, json_output, end="\n", above=False):
+def print_result(res, json_output, err="Error", ok=None):
+    """ displays the outcome of a command : error, json payload or ok message """
+    if res.type == EventType.ERROR :
+        print(f"{err}: {res}")
+        return False
+    if json_output :
+        print_json(res.payload)
+    elif not ok is None :
+        print(ok)
+    return True
+
+def display_message(disp, above=False, out=None):
+    """ prints disp, above the prompt or appended to out for batching """
+    if above :
+        print_above(disp)
+    elif out is None :
+        print(disp, flush=True)
+    else :
+        out.append(disp)
+
+# color of sender names by contact type, others are blue
+CONTACT_COLORS = {
+    2 : ANSI_MAGENTA, # repeater
+    3 : ANSI_CYAN, # room
+    4 : ANSI_YELLOW, # sensor
+}
+
+def format_priv_msg(mc, data, path_str):
+    ct = get_contact_by_key_prefix(mc, data['pubkey_prefix'])
+    if ct is None:
+        logger.debug("Unknown contact with pubkey prefix: %s", data['pubkey_prefix'])
+        name = data["pubkey_prefix"]
+    else:
+        name = ct["adv_name"]
+        process_event_message.last_node=ct
+
+    if ct is None: # Unknown
+        color = ANSI_RED
+    else:
+        color = CONTACT_COLORS.get(ct["type"], ANSI_BLUE)
+    if not 'signature' in data:
+        sig_str = ""
+    else :
+        sender = get_contact_by_key_prefix(mc, data['signature'])
+        if sender is None:
+            sig_str = f"/{ANSI_RED}{data['signature']}"
+        else:
+            sig_str = f"/{ANSI_BLUE}{sender['adv_name']}"
+    text_color = ANSI_LIGHT_GRAY if data["txt_type"] == 1 else ANSI_END
+    return f"{color}{name}{sig_str} {ANSI_ORANGE}({path_str}){text_color}: {data['text']}"
+
+def format_chan_msg(mc, data, path_str):
+    if hasattr(mc, "channels"):
+        ch_name = mc.channels[data['channel_idx']]['channel_name']
+    elif data["channel_idx"] == 0: #public
+        ch_name = "public"
+    else :
+        ch_name = f"ch{data['channel_idx']}"
+    process_event_message.last_node = {"adv_name" : ch_name, "type" : 0, "chan_nb" : data['channel_idx']}
+    return f"{ANSI_GREEN}{ch_name} {ANSI_YELLOW}({path_str}){ANSI_END}{ANSI_END}: {data['text']}"
+
+# message type -> function formatting it for display, others are printed as json
+MSG_FORMATTERS = {
+    "PRIV" : format_priv_msg,
+    "CHAN" : format_chan_msg,
+}
+
+async def process_event_message(mc, ev, json_output, above=False, out=None):
     """ display incoming message """
-    if ev is None :
+    ev_type = None if ev is None else ev.type
+    if ev_type is None :
         logger.error("Event does not contain message.")
-    elif ev.type == EventType.NO_MORE_MSGS:
+    elif ev_type is EventType.NO_MORE_MSGS:
         logger.debug("No more messages")
         return False
-    elif ev.type == EventType.ERROR:
+    elif ev_type is EventType.ERROR:
         logger.error(f"Error retrieving messages: {ev.payload}")
         return False
     elif json_output :
-        if above :
-            print_above(json.dumps(ev.payload))
-        else:
-            print(json.dumps(ev.payload), end=end, flush=True)
+        display_message(dump_json(ev.payload), above, out)
     else :
         await mc.ensure_contacts()
         data = ev.payload
@@ -116,71 +236,14 @@ async def process_event_message(mc, ev, json_output, end="\n", above=False):
         if "SNR" in data and process_event_message.print_snr:
             path_str = path_str + f",{data['SNR']}dB"
 
-        if (data['type'] == "PRIV") :
-            ct = mc.get_contact_by_key_prefix(data['pubkey_prefix'])
-            if ct is None:
-                logger.debug(f"Unknown contact with pubkey prefix: {data['pubkey_prefix']}")
-                name = data["pubkey_prefix"]
-            else:
-                name = ct["adv_name"]
-                process_event_message.last_node=ct
-
-            if ct is None: # Unknown
-                disp = f"{ANSI_RED}"
-            elif ct["type"] == 4 : # sensor
-                disp = f"{ANSI_YELLOW}"
-            elif ct["type"] == 3 : # room
-                disp = f"{ANSI_CYAN}"
-            elif ct["type"] == 2 : # repeater
-                disp = f"{ANSI_MAGENTA}"
-            else:
-                disp = f"{ANSI_BLUE}"
-            disp = disp + f"{name}"
-            if 'signature' in data:
-                sender = mc.get_contact_by_key_prefix(data['signature'])
-                if sender is None:
-                    disp = disp + f"/{ANSI_RED}{data['signature']}"
-                else:
-                    disp = disp + f"/{ANSI_BLUE}{sender['adv_name']}"
-            disp = disp + f" {ANSI_ORANGE}({path_str})"
-            if data["txt_type"] == 1:
-                disp = disp + f"{ANSI_LIGHT_GRAY}"
-            else:
-                disp = disp + f"{ANSI_END}"
-            disp = disp + f": {data['text']}"
-
-            if not process_event_message.color:
-                disp = escape_ansi(disp)
-
-            if above:
-                print_above(disp)
-            else:
-                print(disp, flush=True)
-
-        elif (data['type'] == "CHAN") :
-            path_str = f"{ANSI_YELLOW}({path_str}){ANSI_END}"
-            if hasattr(mc, "channels"):
-                ch_name = mc.channels[data['channel_idx']]['channel_name']
-                disp = f"{ANSI_GREEN}{ch_name} {path_str}"
-                process_event_message.last_node = {"adv_name" : ch_name, "type" : 0, "chan_nb" : data['channel_idx']}
-            elif data["channel_idx"] == 0: #public
-                disp = f"{ANSI_GREEN}public {path_str}"
-                process_event_message.last_node = {"adv_name" : "public", "type" : 0, "chan_nb" : 0}
-            else :
-                disp = f"{ANSI_GREEN}ch{data['channel_idx']} {path_str}"
-                process_event_message.last_node = {"adv_name" : f"ch{data['channel_idx']}", "type" : 0, "chan_nb" : data['channel_idx']}
-            disp = disp + f"{ANSI_END}"
-            disp = disp + f": {data['text']}"
-
+        format_msg = MSG_FORMATTERS.get(data['type'])
+        if format_msg is None :
+            display_message(dump_json(ev.payload), above, out)
+        else :
+            disp = format_msg(mc, data, path_str)
             if not process_event_message.color:
                 disp = escape_ansi(disp)
-
-            if above:
-                print_above(disp)
-            else:
-                print(disp)
-        else:
-            print(json.dumps(ev.payload))
+            display_message(disp, above, out)
     return True
 process_event_message.print_snr=False
 process_event_message.color=True
@@ -191,10 +254,10 @@ async def handle_advert(event):
         return
 
     if handle_message.json_output:
-        msg = json.dumps({"event": "advert", "public_key" : event.payload["public_key"]})
+        msg = dump_json({"event": "advert", "public_key" : event.payload["public_key"]})
     else:
         key = event.payload["public_key"]
-        contact = handle_advert.mc.get_contact_by_key_prefix(key)
+        contact = get_contact_by_key_prefix(handle_advert.mc, key)
         name = "<Unknown Contact>"
 
         if not contact is None :
@@ -214,10 +277,10 @@ async def handle_path_update(event):
         return
 
     if handle_message.json_output:
-        msg = json.dumps({"event": "path_update", "public_key" : event.payload["public_key"]})
+        msg = dump_json({"event": "path_update", "public_key" : event.payload["public_key"]})
     else:
         key = event.payload["public_key"]
-        contact = handle_path_update.mc.get_contact_by_key_prefix(key)
+        contact = get_contact_by_key_prefix(handle_path_update.mc, key)
         name = "<Unknown Contact>"
 
         if not contact is None :
@@ -237,7 +300,7 @@ async def handle_new_contact(event):
         return
 
     if handle_message.json_output:
-        msg = json.dumps({"event": "new_contact", "contact" : event.payload})
+        msg = dump_json({"event": "new_contact", "contact" : event.payload})
     else:
         key = event.payload["public_key"]
         name = event.payload["adv_name"]
@@ -250,22 +313,26 @@ async def handle_new_contact(event):
         print(msg)
 handle_new_contact.print_new_contacts=False
 
+async def handle_contacts(event):
+    """ the contact list was (re)loaded from the node """
+    contacts_changed()
+
 async def log_message(mc, msg):
     if log_message.file is None:
         return
 
     if msg["type"] == "PRIV" :
-        ct = mc.get_contact_by_key_prefix(msg['pubkey_prefix'])
+        ct = get_contact_by_key_prefix(mc, msg['pubkey_prefix'])
         if ct is None:
-            msg["name"] = data["pubkey_prefix"]
+            msg["name"] = msg["pubkey_prefix"]
         else:
             msg["name"] = ct["adv_name"]
     elif msg["type"] == "CHAN" :
         msg["name"] = f"channel {msg['channel_idx']}"
-    msg["timestamp"] = int(time.time())
+    msg["timestamp"] = time.time_ns() // 1_000_000_000
 
-    with open(log_message.file, "a") as logfile:
-        logfile.write(json.dumps(msg) + "\n")
+    with open(log_message.file, "a", encoding="utf-8") as logfile:
+        logfile.write(dump_json(msg) + "\n")
 
 log_message.file=None
 
@@ -296,9 +363,122 @@ async def subscribe_to_msgs(mc, json_output=False, above=False):
         CS = mc.subscribe(EventType.CHANNEL_MSG_RECV, handle_message)
     await mc.start_auto_message_fetching()
 
+# completions of set and get for the local node
+SET_COMPLETIONS = {
+    "name" : None,
+    "pin" : None,
+    "radio" : {",,,":None, "f,bw,sf,cr":None},
+    "tx" : None,
+    "tuning" : {",", "af,tx_d"},
+    "lat" : None,
+    "lon" : None,
+    "coords" : None,
+    "print_snr" : {"on":None, "off": None},
+    "json_msgs" : {"on":None, "off": None},
+    "color" : {"on":None, "off":None},
+    "print_name" : {"on":None, "off":None},
+    "print_adverts" : {"on":None, "off":None},
+    "print_new_contacts" : {"on": None, "off":None},
+    "print_path_updates" : {"on":None,"off":None},
+    "classic_prompt" : {"on" : None, "off":None},
+    "manual_add_contacts" : {"on" : None, "off":None},
+    "telemetry_mode_base" : {"always" : None, "device":None, "never":None},
+    "telemetry_mode_loc" : {"always" : None, "device":None, "never":None},
+    "telemetry_mode_env" : {"always" : None, "device":None, "never":None},
+    "advert_loc_policy" : {"none" : None, "share" : None},
+    "auto_update_contacts" : {"on":None, "off":None},
+    "max_attempts" : None,
+    "max_flood_attempts" : None,
+    "flood_after" : None,
+}
+GET_COMPLETIONS = {
+    "name":None,
+    "bat":None,
+    "fstats": None,
+    "radio":None,
+    "tx":None,
+    "coords":None,
+    "lat":None,
+    "lon":None,
+    "print_snr":None,
+    "json_msgs":None,
+    "color":None,
+    "print_name":None,
+    "print_adverts":None,
+    "print_path_updates":None,
+    "print_new_contacts":None,
+    "classic_prompt":None,
+    "manual_add_contacts":None,
+    "telemetry_mode_base":None,
+    "telemetry_mode_loc":None,
+    "telemetry_mode_env":None,
+    "advert_loc_policy":None,
+    "auto_update_contacts":None,
+    "max_attempts":None,
+    "max_flood_attempts":None,
+    "flood_after":None,
+    "custom":None,
+}
+
+# completions of set and get for repeaters and room servers, perm is added with contacts
+REPEATER_SET_COMPLETIONS = {
+    "name" : None,
+    "radio" : {",,,":None, "f,bw,sf,cr": None},
+    "freq" : None,
+    "tx" : None,
+    "af": None,
+    "repeat" : {"on": None, "off": None},
+    "flood.advert.interval" : None,
+    "flood.max" : None,
+    "advert.interval" : None,
+    "guest.password" : None,
+    "allow.read.only" : {"on": None, "off": None},
+    "rxdelay" : None,
+    "txdelay": None,
+    "direct.txdelay" : None,
+    "lat" : None,
+    "lon" : None,
+    "timeout" : None,
+    "bridge.enabled":{"on": None, "off": None},
+    "bridge.delay":None,
+    "bridge.source":None,
+    "bridge.baud":None,
+    "bridge.secret":None,
+}
+REPEATER_GET_COMPLETIONS = {
+    "name" : None,
+    "role":None,
+    "radio" : None,
+    "freq":None,
+    "tx":None,
+    "af" : None,
+    "repeat" : None,
+    "allow.read.only" : None,
+    "flood.advert.interval" : None,
+    "flood.max":None,
+    "advert.interval" : None,
+    "guest.password" : None,
+    "rxdelay": None,
+    "txdelay": None,
+    "direct.tx_delay":None,
+    "public.key":None,
+    "lat" : None,
+    "lon" : None,
+    "telemetry" : None,
+    "status" : None,
+    "timeout" : None,
+    "acl":None,
+    "bridge.enabled":None,
+    "bridge.delay":None,
+    "bridge.source":None,
+    "bridge.baud":None,
+    "bridge.secret":None,
+    "bridge.type":None,
+}
+
 def make_completion_dict(contacts, pending={}, to=None, channels=None):
-    contact_list = {}
-    pending_list = {}
+    contact_list = dict.fromkeys(c['adv_name'] for c in contacts.values())
+    pending_list = dict.fromkeys(c['public_key'] for c in pending.values())
     to_list = {}
 
     to_list["~"] = None
@@ -308,14 +488,6 @@ def make_completion_dict(contacts, pending={}, to=None, channels=None):
     to_list[".."] = None
     to_list["public"] = None
 
-    it = iter(contacts.items())
-    for c in it :
-        contact_list[c[1]['adv_name']] = None
-
-    pit = iter(pending.items())
-    for c in pit :
-        pending_list[c[1]['public_key']] = None
-
     to_list.update(contact_list)
 
     to_list["ch"] = None
@@ -375,63 +547,9 @@ def make_completion_dict(contacts, pending={}, to=None, channels=None):
             "set_channel": None,
             "get_channels": None,
             "remove_channel": None,
-            "set" : {
-                    "name" : None,
-                    "pin" : None,
-                    "radio" : {",,,":None, "f,bw,sf,cr":None},
-                    "tx" : None,
-                    "tuning" : {",", "af,tx_d"},
-                    "lat" : None,
-                    "lon" : None,
-                    "coords" : None,
-                    "print_snr" : {"on":None, "off": None},
-                    "json_msgs" : {"on":None, "off": None},
-                    "color" : {"on":None, "off":None},
-                    "print_name" : {"on":None, "off":None},
-                    "print_adverts" : {"on":None, "off":None},
-                    "print_new_contacts" : {"on": None, "off":None},
-                    "print_path_updates" : {"on":None,"off":None},
-                    "classic_prompt" : {"on" : None, "off":None},
-                    "manual_add_contacts" : {"on" : None, "off":None},
-                    "telemetry_mode_base" : {"always" : None, "device":None, "never":None},
-                    "telemetry_mode_loc" : {"always" : None, "device":None, "never":None},
-                    "telemetry_mode_env" : {"always" : None, "device":None, "never":None},
-                    "advert_loc_policy" : {"none" : None, "share" : None},
-                    "auto_update_contacts" : {"on":None, "off":None},
-                    "max_attempts" : None,
-                    "max_flood_attempts" : None,
-                    "flood_after" : None,
-                    },
-            "get" : {"name":None,
-                     "bat":None,
-                     "fstats": None,
-                     "radio":None,
-                     "tx":None,
-                     "coords":None,
-                     "lat":None,
-                     "lon":None,
-                     "print_snr":None,
-                     "json_msgs":None,
-                     "color":None,
-                     "print_name":None,
-                     "print_adverts":None,
-                     "print_path_updates":None,
-                     "print_new_contacts":None,
-                     "classic_prompt":None,
-                     "manual_add_contacts":None,
-                     "telemetry_mode_base":None,
-                     "telemetry_mode_loc":None,
-                     "telemetry_mode_env":None,
-                     "advert_loc_policy":None,
-                     "auto_update_contacts":None,
-                     "max_attempts":None,
-                     "max_flood_attempts":None,
-                     "flood_after":None,
-                     "custom":None,
-                     },
+            "set" : {**SET_COMPLETIONS, **make_completion_dict.custom_vars},
+            "get" : {**GET_COMPLETIONS, **make_completion_dict.custom_vars},
         })
-        completion_list["set"].update(make_completion_dict.custom_vars)
-        completion_list["get"].update(make_completion_dict.custom_vars)
     else :
         completion_list.update({
             "send" : None,
@@ -485,59 +603,8 @@ def make_completion_dict(contacts, pending={}, to=None, channels=None):
                          "advert" : {"none": None, "share": None, "prefs": None}, 
                 },
                 "sensor": {"list": None, "set": {"gps": None}, "get": {"gps": None}},
-                "get" : {"name" : None,
-                         "role":None,
-                         "radio" : None,
-                         "freq":None,
-                         "tx":None,
-                         "af" : None,
-                         "repeat" : None,
-                         "allow.read.only" : None,
-                         "flood.advert.interval" : None,
-                         "flood.max":None,
-                         "advert.interval" : None,
-                         "guest.password" : None,
-                         "rxdelay": None,
-                         "txdelay": None,
-                         "direct.tx_delay":None,
-                         "public.key":None,
-                         "lat" : None,
-                         "lon" : None,
-                         "telemetry" : None,
-                         "status" : None,
-                         "timeout" : None,
-                         "acl":None,
-                         "bridge.enabled":None,
-                         "bridge.delay":None,
-                         "bridge.source":None,
-                         "bridge.baud":None,
-                         "bridge.secret":None,
-                         "bridge.type":None,
-                         },
-                "set" : {"name" : None,
-                         "radio" : {",,,":None, "f,bw,sf,cr": None},
-                         "freq" : None,
-                         "tx" : None,
-                         "af": None,
-                         "repeat" : {"on": None, "off": None},
-                         "flood.advert.interval" : None,
-                         "flood.max" : None,
-                         "advert.interval" : None,
-                         "guest.password" : None,
-                         "allow.read.only" : {"on": None, "off": None},
-                         "rxdelay" : None,
-                         "txdelay": None,
-                         "direct.txdelay" : None,
-                         "lat" : None,
-                         "lon" : None,
-                         "timeout" : None,
-                         "perm":contact_list,
-                         "bridge.enabled":{"on": None, "off": None},
-                         "bridge.delay":None,
-                         "bridge.source":None,
-                         "bridge.baud":None,
-                         "bridge.secret":None,
-                         },
+                "get" : dict(REPEATER_GET_COMPLETIONS),
+                "set" : {**REPEATER_SET_COMPLETIONS, "perm" : contact_list},
                 "erase": None,
                 "log" : {"start" : None, "stop" : None, "erase" : None}
             })
@@ -547,9 +614,7 @@ def make_completion_dict(contacts, pending={}, to=None, channels=None):
                 "req_mma":{"begin end":None},
             })
 
-            completion_list["get"].update({
-                "mma":None,
-            })
+            completion_list["get"]["mma"] = None
 
             completion_list["set"].update({
             })
@@ -562,6 +627,98 @@ def make_completion_dict(contacts, pending={}, to=None, channels=None):
     return completion_list
 make_completion_dict.custom_vars = {}
 
+def make_completer(mc, to=None):
+    """ completer for the prompt, only rebuilt when its inputs change """
+    key = (None if to is None else to["type"],
+           tuple(c["adv_name"] for c in mc.contacts.values()),
+           tuple(mc.pending_contacts),
+           process_event_message.last_node is None,
+           tuple(c["channel_name"] for c in mc.channels),
+           tuple(make_completion_dict.custom_vars))
+    if key != make_completer.key :
+        make_completer.completer = NestedCompleter.from_nested_dict(
+                make_completion_dict(mc.contacts, mc.pending_contacts,
+                                     to=to, channels=mc.channels))
+        make_completer.key = key
+    return make_completer.completer
+make_completer.key = None
+make_completer.completer = None
+
+def make_prompt(mc, contact, last_ack):
+    """ prompt for interactive mode, only rebuilt when its state changes """
+    key = (None if contact is None else (contact["adv_name"], contact["type"]),
+           last_ack, mc.self_info['name'], process_event_message.color,
+           interactive_loop.classic, interactive_loop.print_name)
+    if key == make_prompt.key :
+        return make_prompt.prompt
+
+    color = process_event_message.color
+    classic = interactive_loop.classic or not color
+    print_name = interactive_loop.print_name
+
+    if classic:
+        prompt = ""
+    else:
+        prompt = f"{ANSI_INVERT}"
+
+    # some possible symbols for prompts 🭬🬛🬗🭬🬛🬃🬗🭬🬛🬃🬗🬏🭀🭋🭨🮋
+    if print_name or contact is None :
+        prompt = prompt + f"{ANSI_BGRAY}"
+        prompt = prompt + f"{mc.self_info['name']}"
+        if classic :
+            prompt = prompt + " > "
+        else :
+            prompt = prompt + "🭨"
+
+    if not contact is None :
+        if not last_ack:
+            prompt = prompt + f"{ANSI_BRED}"
+            if classic :
+                prompt = prompt + "!"
+        elif contact["type"] == 4 : # sensor
+            prompt = prompt + f"{ANSI_BYELLOW}"
+        elif contact["type"] == 3 : # room server
+            prompt = prompt + f"{ANSI_BCYAN}"
+        elif contact["type"] == 2 :
+            prompt = prompt + f"{ANSI_BMAGENTA}"
+        elif contact["type"] == 0 : # public channel
+            prompt = prompt + f"{ANSI_BGREEN}"
+        else :
+            prompt = prompt + f"{ANSI_BBLUE}"
+        if not classic:
+            prompt = prompt + f"{ANSI_INVERT}"
+
+        if print_name and not classic :
+            prompt = prompt + "🭬"
+
+        prompt = prompt + f"{contact['adv_name']}"
+        if classic :
+            prompt = prompt + f"{ANSI_NORMAL} > "
+        else:
+            prompt = prompt + f"{ANSI_NORMAL}🭬"
+
+        prompt = prompt + f"{ANSI_END}"
+
+        if not color :
+            prompt=escape_ansi(prompt)
+
+    make_prompt.prompt = ANSI(prompt)
+    make_prompt.key = key
+    return make_prompt.prompt
+make_prompt.key = None
+make_prompt.prompt = None
+
+# commands forwarded to current contact in interactive mode, without parameter
+CONTACT_CMDS = frozenset(("sc", "share_contact", "ec", "export_contact",
+                          "uc", "upload_contact", "rp", "reset_path",
+                          "dp", "disc_path", "contact_info", "ci",
+                          "req_status", "rs", "req_bstatus", "rbs",
+                          "req_telemetry", "rt", "req_acl", "path", "logout"))
+# commands forwarded to current contact in interactive mode, with a parameter
+CONTACT_PARAM_CMDS = frozenset(("cmd", "cp", "change_path", "cf", "change_flags",
+                                "req_binary", "login"))
+REMOTE_GET_PREFIXES = ("get telemetry", "get status", "get acl")
+
 async def interactive_loop(mc, to=None) :
     print("""Interactive mode, most commands from terminal chat should work.
 Use \"to\" to select recipient, use Tab to complete name ...
@@ -579,23 +736,39 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
     handle_new_contact.print_new_contacts = True
 
     try:
+        get_msg = mc.commands.get_msg
+        no_more_msgs = EventType.NO_MORE_MSGS
         while True: # purge msgs
-            res = await mc.commands.get_msg()
-            if res.type == EventType.NO_MORE_MSGS:
+            res = await get_msg()
+            if res.type is no_more_msgs:
                 break
 
-        if os.path.isdir(MCCLI_CONFIG_DIR) :
-            our_history = FileHistory(MCCLI_HISTORY_FILE)
-        else:
-            our_history = None
+        # session and bindings are kept for the next time we enter chat
+        if interactive_loop.session is None :
+            if os.path.isdir(MCCLI_CONFIG_DIR) :
+                our_history = FileHistory(MCCLI_HISTORY_FILE)
+            else:
+                our_history = None
+
+            # beware, mouse support breaks mouse scroll ...
+            session = PromptSession(history=our_history,
+                                    wrap_lines=False,
+                                    mouse_support=False,
+                                    complete_style=CompleteStyle.MULTI_COLUMN)
+            session.app.ttimeoutlen = 0.2
+            session.app.timeoutlen = 0.2
 
-        # beware, mouse support breaks mouse scroll ...
-        session = PromptSession(history=our_history,
-                                wrap_lines=False,
-                                mouse_support=False,
-                                complete_style=CompleteStyle.MULTI_COLUMN)
+            bindings = KeyBindings()
 
-        bindings = KeyBindings()
+            # Add our own key binding.
+            @bindings.add("escape")
+            def _(event):
+                event.app.current_buffer.cancel_completion()
+
+            interactive_loop.session = session
+            interactive_loop.bindings = bindings
+        session = interactive_loop.session
+        bindings = interactive_loop.bindings
 
         res = await mc.commands.get_custom_vars()
         cv = []
@@ -603,90 +776,33 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
             cv = list(res.payload.keys())
         make_completion_dict.custom_vars = {k:None for k in cv}
 
-        # Add our own key binding.
-        @bindings.add("escape")
-        def _(event):
-            event.app.current_buffer.cancel_completion()
-
         last_ack = True
         while True:
-            color = process_event_message.color
-            classic = interactive_loop.classic or not color
-            print_name = interactive_loop.print_name
+            prompt = make_prompt(mc, contact, last_ack)
 
-            if classic:
-                prompt = ""
-            else:
-                prompt = f"{ANSI_INVERT}"
-
-            # some possible symbols for prompts 🭬🬛🬗🭬🬛🬃🬗🭬🬛🬃🬗🬏🭀🭋🭨🮋
-            if print_name or contact is None :
-                prompt = prompt + f"{ANSI_BGRAY}"
-                prompt = prompt + f"{mc.self_info['name']}"
-                if classic :
-                    prompt = prompt + " > "
-                else :
-                    prompt = prompt + "🭨"
-
-            if not contact is None :
-                if not last_ack:
-                    prompt = prompt + f"{ANSI_BRED}"
-                    if classic :
-                        prompt = prompt + "!"
-                elif contact["type"] == 4 : # sensor
-                    prompt = prompt + f"{ANSI_BYELLOW}"
-                elif contact["type"] == 3 : # room server
-                    prompt = prompt + f"{ANSI_BCYAN}"
-                elif contact["type"] == 2 :
-                    prompt = prompt + f"{ANSI_BMAGENTA}"
-                elif contact["type"] == 0 : # public channel
-                    prompt = prompt + f"{ANSI_BGREEN}"
-                else :
-                    prompt = prompt + f"{ANSI_BBLUE}"
-                if not classic:
-                    prompt = prompt + f"{ANSI_INVERT}"
+            completer = make_completer(mc, contact)
 
-                if print_name and not classic :
-                    prompt = prompt + "🭬"
-
-                prompt = prompt + f"{contact['adv_name']}"
-                if classic :
-                    prompt = prompt + f"{ANSI_NORMAL} > "
-                else:
-                    prompt = prompt + f"{ANSI_NORMAL}🭬"
-
-                prompt = prompt + f"{ANSI_END}"
-
-                if not color :
-                    prompt=escape_ansi(prompt)
-
-            session.app.ttimeoutlen = 0.2
-            session.app.timeoutlen = 0.2
-
-            completer = NestedCompleter.from_nested_dict(
-                            make_completion_dict(mc.contacts,
-                                    mc.pending_contacts,
-                                    to=contact,
-                                    channels = mc.channels))
-
-            line = await session.prompt_async(ANSI(prompt),
+            line = await session.prompt_async(prompt,
                                               complete_while_typing=False,
                                               completer=completer,
                                               key_bindings=bindings)
 
+            # first token of the line, most of the tests below are made on it
+            cmd, sep, rest = line.partition(" ")
+
             if line == "" : # blank line
                 pass
 
             # raw meshcli command as on command line
             elif line.startswith("$") :
-                args = shlex.split(line[1:])
+                args = split_args(line[1:])
                 await process_cmds(mc, args)
 
-            elif line.startswith("to ") : # dest
-                dest = line[3:]
-                if dest.startswith("\"") or dest.startswith("\'") : # if name starts with a quote
+            elif cmd == "to" and sep : # dest
+                dest = rest
+                if dest.startswith(("\"", "\'")) : # if name starts with a quote
                     dest = shlex.split(dest)[0] # use shlex.split to get contact name between quotes
-                nc = mc.get_contact_by_name(dest)
+                nc = get_contact_by_name(mc, dest)
                 if nc is None:
                     if dest == "public" :
                         nc = {"adv_name" : "public", "type" : 0, "chan_nb" : 0}
@@ -727,10 +843,8 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
                 break
 
             # commands that take one parameter (don't need quotes)
-            elif line.startswith("public ") :
-                cmds = line.split(" ", 1)
-                args = [cmds[0], cmds[1]]
-                await process_cmds(mc, args)
+            elif cmd == "public" and sep :
+                await process_cmds(mc, [cmd, rest])
 
             # lines starting with ! are sent as reply to last received msg
             elif line.startswith("!"):
@@ -746,22 +860,11 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
 
             # commands are passed through if at root
             elif contact is None or line.startswith(".") :
-                args = shlex.split(line)
+                args = split_args(line)
                 await process_cmds(mc, args)
 
             # commands that take contact as second arg will be sent to recipient
-            elif contact["type"] > 0 and (line == "sc" or line == "share_contact" or\
-                    line == "ec" or line == "export_contact" or\
-                    line == "uc" or line == "upload_contact" or\
-                    line == "rp" or line == "reset_path" or\
-                    line == "dp" or line == "disc_path" or\
-                    line == "contact_info" or line == "ci" or\
-                    line == "req_status" or line == "rs" or\
-                    line == "req_bstatus" or line == "rbs" or\
-                    line == "req_telemetry" or line == "rt" or\
-                    line == "req_acl" or\
-                    line == "path" or\
-                    line == "logout" ) :
+            elif contact["type"] > 0 and line in CONTACT_CMDS :
                 args = [line, contact['adv_name']]
                 await process_cmds(mc, args)
 
@@ -775,7 +878,7 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
             elif contact["type"] == 4 and\
                     (line.startswith("get mma ")) or\
                  contact["type"] > 1 and\
-                    (line.startswith("get telemetry") or line.startswith("get status") or line.startswith("get acl")):
+                    line.startswith(REMOTE_GET_PREFIXES):
                 cmds = line.split(" ")
                 args = [f"req_{cmds[1]}", contact['adv_name']]
                 if len(cmds) > 2 :
@@ -786,9 +889,9 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
 
             # special treatment for setperm to support contact name as param
             elif contact["type"] > 1 and\
-                (line.startswith("setperm ") or line.startswith("set perm ")):
+                line.startswith(("setperm ", "set perm ")):
                 try:
-                    cmds = shlex.split(line)
+                    cmds = split_args(line)
                     off = 1 if line.startswith("set perm") else 0
                     name = cmds[1 + off]
                     perm_string = cmds[2 + off]
@@ -798,9 +901,9 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
                         perm = int(perm_string[1:])
                     else:
                         perm = int(perm_string,16)
-                    ct=mc.get_contact_by_name(name)
+                    ct=get_contact_by_name(mc, name)
                     if ct is None:
-                        ct=mc.get_contact_by_key_prefix(name)
+                        ct=get_contact_by_key_prefix(mc, name)
                     if ct is None:
                         if name == "self" or mc.self_info["public_key"].startswith(name):
                             key = mc.self_info["public_key"]
@@ -814,26 +917,17 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
                     print("Wrong number of parameters")
 
             # trace called on a contact
-            elif contact["type"] > 0 and (
-                    line == "trace" or line == "tr") :
+            elif contact["type"] > 0 and line in ("trace", "tr") :
                 await print_trace_to(mc, contact)
 
-            elif contact["type"] > 0 and (
-                    line == "dtrace" or line == "dt") :
+            elif contact["type"] > 0 and line in ("dtrace", "dt") :
                 await print_disc_trace_to(mc, contact)
                 
             # same but for commands with a parameter
-            elif contact["type"] > 0 and (line.startswith("cmd ") or\
-                    line.startswith("cp ") or line.startswith("change_path ") or\
-                    line.startswith("cf ") or line.startswith("change_flags ") or\
-                    line.startswith("req_binary ") or\
-                    line.startswith("login ")) :
-                cmds = line.split(" ", 1)
-                args = [cmds[0], contact['adv_name'], cmds[1]]
-                await process_cmds(mc, args)
+            elif contact["type"] > 0 and sep and cmd in CONTACT_PARAM_CMDS :
+                await process_cmds(mc, [cmd, contact['adv_name'], rest])
 
-            elif contact["type"] == 4 and \
-                (line.startswith("req_mma ") or line.startswith('rm ')) :
+            elif contact["type"] == 4 and sep and cmd in ("req_mma", "rm") :
                 cmds = line.split(" ")
                 if len(cmds) < 3 :
                     cmds.append("0")
@@ -849,16 +943,9 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
                 await process_cmds(mc, args)
 
             elif line == "list" : # list command from chat displays contacts on a line
-                it = iter(mc.contacts.items())
-                first = True
-                for c in it :
-                    if not first:
-                        print(", ", end="")
-                    first = False
-                    print(f"{c[1]['adv_name']}", end="")
-                print("")
-
-            elif line.startswith("send") or line.startswith("\"") :
+                print(", ".join(c["adv_name"] for c in mc.contacts.values()))
+
+            elif line.startswith(("send", "\"")) :
                 if line.startswith("send") :
                     line = line[5:]
                 if line.startswith("\"") :
@@ -883,11 +970,12 @@ Line starting with \"$\" or \".\" will issue a meshcli command.
         print("Exiting cli")
 interactive_loop.classic = False
 interactive_loop.print_name = True
+interactive_loop.session = None
+interactive_loop.bindings = None
 
 async def send_cmd (mc, contact, cmd) :
     res = await mc.commands.send_cmd(contact, cmd)
     if not res is None and not res.type == EventType.ERROR:
-        res.payload["expected_ack"] = res.payload["expected_ack"].hex()
         if isinstance(contact, dict):
             sent = res.payload.copy()
             sent["type"] = "SENT_CMD"
@@ -913,7 +1001,6 @@ async def send_chan_msg(mc, nb, msg):
 async def send_msg (mc, contact, msg) :
     res = await mc.commands.send_msg(contact, msg)
     if not res is None and not res.type == EventType.ERROR:
-        res.payload["expected_ack"] = res.payload["expected_ack"].hex()
         if isinstance(contact, dict):
             sent = res.payload.copy()
             sent["type"] = "SENT_MSG"
@@ -932,7 +1019,6 @@ async def msg_ack (mc, contact, msg) :
                 max_flood_attempts=msg_ack.max_flood_attempts,
                 timeout=timeout)
     if not res is None and not res.type == EventType.ERROR:
-        res.payload["expected_ack"] = res.payload["expected_ack"].hex()
         if isinstance(contact, dict):
             sent = res.payload.copy()
             sent["type"] = "SENT_MSG"
@@ -999,6 +1085,64 @@ async def get_channel_by_name (mc, name):
 
     return None
 
+def get_contact_by_name(mc, name):
+    """ same as mc.get_contact_by_name but using an index on lowercased names,
+        rebuilt from mc.contacts when it misses or holds a stale entry """
+    key = name.lower()
+    ct = get_contact_by_name.index.get(key)
+    if not ct is None and ct.get("adv_name", "").lower() == key\
+            and mc.contacts.get(ct["public_key"]) is ct :
+        return ct
+    index = {}
+    for c in mc.contacts.values() : # first contact with a name wins, as in the lib
+        index.setdefault(c.get("adv_name", "").lower(), c)
+    get_contact_by_name.index = index
+    return index.get(key)
+get_contact_by_name.index = {}
+
+def get_contact_by_key_prefix(mc, prefix):
+    """ same as mc.get_contact_by_key_prefix but remembering the contacts found,
+        so repeated senders don't scan the contact list """
+    key = prefix.lower()
+    ct = get_contact_by_key_prefix.cache.get(key)
+    if not ct is None and mc.contacts.get(ct["public_key"]) is ct :
+        return ct
+    ct = mc.get_contact_by_key_prefix(prefix)
+    if not ct is None :
+        get_contact_by_key_prefix.cache[key] = ct
+    return ct
+get_contact_by_key_prefix.cache = {}
+
+def contacts_changed():
+    """ to be called when contacts are added to or removed from mc.contacts,
+        another contact may now match a cached prefix """
+    get_contact_by_key_prefix.cache.clear()
+
+async def resolve_contact(mc, name, json_output, follow=False):
+    """ contact from its name, prints an error and returns None if unknown """
+    await mc.ensure_contacts(follow=follow)
+    contact = get_contact_by_name(mc, name)
+    if contact is None:
+        if json_output :
+            print_json({"error" : "contact unknown", "name" : name})
+        else:
+            print(f"Unknown contact {name}")
+    return contact
+
+# self_info is not queried again before this delay (in seconds)
+SELF_INFO_TTL = 2
+
+async def ensure_self_info(mc):
+    """ refreshes mc.self_info with send_appstart, unless done less than
+        SELF_INFO_TTL ago and no command changing the node state (set, reboot,
+        advert) was issued since """
+    now = time.monotonic()
+    if now < ensure_self_info.fresh_until :
+        return
+    await mc.commands.send_appstart()
+    ensure_self_info.fresh_until = now + SELF_INFO_TTL
+ensure_self_info.fresh_until = 0
+
 async def get_contacts (mc, anim=False, lastomod=0, timeout=5) :
     if anim:
         print("Fetching contacts ", end="", flush=True)
@@ -1062,9 +1206,11 @@ async def get_channels (mc, anim=False) :
 
     ch = 0;
     mc.channels = []
+    get_channel = mc.commands.get_channel
+    error = EventType.ERROR
     while True:
-        res = await mc.commands.get_channel(ch)
-        if res.type == EventType.ERROR:
+        res = await get_channel(ch)
+        if res.type is error:
             break
         info = res.payload
         info["channel_secret"] = info["channel_secret"].hex()
@@ -1144,106 +1290,116 @@ async def print_disc_trace_to (mc, contact):
 
     await next_cmd(mc, ["trace", trace])
 
-async def next_cmd(mc, cmds, json_output=False):
-    """ process next command """
-    try :
-        argnum = 0
-        if cmds[0].startswith(".") : # override json_output
-            json_output = True
-            cmd = cmds[0][1:]
+# command handlers, they get the whole command line and return the number
+# of args they consumed (or None to stop processing)
+
+async def do_help(mc, cmds, json_output):
+    command_help()
+    return 0
+
+async def do_ver(mc, cmds, json_output):
+    res = await mc.commands.send_device_query()
+    logger.debug(res)
+    if res.type == EventType.ERROR :
+        print(f"ERROR: {res}")
+    elif json_output :
+        print_json(res.payload)
+    else :
+        print("Device info :")
+        if res.payload["fw ver"] >= 3:
+            print(f" Model: {res.payload['model']}")
+            print(f" Version: {res.payload['ver']}")
+            print(f" Build date: {res.payload['fw_build']}")
+        else :
+            print(f" Firmware version : {res.payload['fw ver']}")
+    return 0
+
+async def do_clock(mc, cmds, json_output):
+    if len(cmds) > 1 and cmds[1] == "sync" :
+        await do_sync_time(mc, cmds, json_output)
+        return 1
+
+    res = await mc.commands.get_time()
+    if res.type == EventType.ERROR:
+        print(f"Error getting time: {res}")
+    elif json_output :
+        print_json(res.payload)
+    else :
+        timestamp = res.payload["time"]
+        print('Current time :'
+            f' {time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp))}'
+            f' ({timestamp})')
+    return 0
+
+async def do_sync_time(mc, cmds, json_output): # keep if for the st shortcut
+    res = await mc.commands.set_time(time.time_ns() // 1_000_000_000)
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        if res.payload["error_code"] == 6 :
+            if json_output:
+                print_json({"ok": "No sync needed"})
+            else:
+                print("No time sync needed")
+        elif json_output :
+            print_json({"error" : "Error syncing time"})
         else:
-            cmd = cmds[0]
-        match cmd :
-            case "help" :
-                command_help()
-
-            case "ver" | "query" | "v" | "q":
-                res = await mc.commands.send_device_query()
-                logger.debug(res)
-                if res.type == EventType.ERROR :
-                    print(f"ERROR: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
-                else :
-                    print("Device info :")
-                    if res.payload["fw ver"] >= 3:
-                        print(f" Model: {res.payload['model']}")
-                        print(f" Version: {res.payload['ver']}")
-                        print(f" Build date: {res.payload['fw_build']}")
-                    else :
-                        print(f" Firmware version : {res.payload['fw ver']}")
-
-            case "clock" :
-                if len(cmds) > 1 and cmds[1] == "sync" :
-                    argnum=1
-                    res = await mc.commands.set_time(int(time.time()))
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        if res.payload["error_code"] == 6 :
-                            if json_output:
-                                print(json.dumps({"ok": "No sync needed"}))
-                            else:
-                                print("No time sync needed")
-                        elif json_output :
-                            print(json.dumps({"error" : "Error syncing time"}))
-                        else:
-                            print(f"Error syncing time: {res}")
-                    elif json_output :
-                        res.payload["ok"] = "time synced"
-                        print(json.dumps(res.payload, indent=4))
-                    else :
-                        print("Time synced")
-                else:
-                    res = await mc.commands.get_time()
-                    timestamp = res.payload["time"]
-                    if res.type == EventType.ERROR:
-                        print(f"Error getting time: {res}")
-                    elif json_output :
-                        print(json.dumps(res.payload, indent=4))
-                    else :
-                        print('Current time :'
-                            f' {datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")}'
-                            f' ({timestamp})')
-
-            case "sync_time"|"clock sync"|"st": # keep if for the st shortcut
-                res = await mc.commands.set_time(int(time.time()))
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    if res.payload["error_code"] == 6 :
-                        if json_output:
-                            print(json.dumps({"ok": "No sync needed"}))
-                        else:
-                            print("No time sync needed")
-                    elif json_output :
-                        print(json.dumps({"error" : "Error syncing time"}))
-                    else:
-                        print(f"Error syncing time: {res}")
-                elif json_output :
-                    res.payload["ok"] = "time synced"
-                    print(json.dumps(res.payload, indent=4))
-                else:
-                    print("Time synced")
+            print(f"Error syncing time: {res}")
+    elif json_output :
+        print_json({**res.payload, "ok" : "time synced"})
+    else:
+        print("Time synced")
+    return 0
 
-            case "time" :
-                argnum = 1
-                res = await mc.commands.set_time(cmds[1])
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    if json_output :
-                        print(json.dumps({"error" : "Error setting time"}))
-                    else:
-                        print (f"Error setting time: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
-                else:
-                    print("Time set")
-
-            case "set":
-                argnum = 2
-                match cmds[1]:
-                    case "help" :
-                        argnum = 1
-                        print("""Available parameters :
+async def do_time(mc, cmds, json_output):
+    res = await mc.commands.set_time(cmds[1])
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        if json_output :
+            print_json({"error" : "Error setting time"})
+        else:
+            print (f"Error setting time: {res}")
+    elif json_output :
+        print_json(res.payload)
+    else:
+        print("Time set")
+    return 1
+
+# display settings (on/off) : name -> (function holding it, attribute)
+DISPLAY_SETTINGS = {
+    "print_name" : (interactive_loop, "print_name"),
+    "classic_prompt" : (interactive_loop, "classic"),
+    "color" : (process_event_message, "color"),
+    "print_snr" : (process_event_message, "print_snr"),
+    "print_adverts" : (handle_advert, "print_adverts"),
+    "print_path_updates" : (handle_path_update, "print_path_updates"),
+    "print_new_contacts" : (handle_new_contact, "print_new_contacts"),
+    "json_msgs" : (handle_message, "json_output"),
+}
+
+# values accepted as true/on, and for telemetry modes all (2) and selected (1)
+ON_VALUES = frozenset(("on", "true", "yes", "1"))
+TELEMETRY_MODE_ALL = frozenset(("2", "all", "yes", "on"))
+TELEMETRY_MODE_SELECTED = frozenset(("1", "selected", "dev"))
+
+# node params for set : name -> (mc.commands method, args from (mc, value))
+NODE_PARAMS = {
+    "pin" : ("set_devicepin", lambda mc, v : (v,)),
+    "radio" : ("set_radio", lambda mc, v : split_params(v, 4)),
+    "name" : ("set_name", lambda mc, v : (v,)),
+    "tx" : ("set_tx_power", lambda mc, v : (v,)),
+    "lat" : ("set_coords", lambda mc, v : (float(v), mc.self_info.get("adv_lon", 0))),
+    "lon" : ("set_coords", lambda mc, v : (mc.self_info.get("adv_lat", 0), float(v))),
+    "coords" : ("set_coords", lambda mc, v : split_params(v, 2, float)),
+    "tuning" : ("set_tuning", lambda mc, v : split_params(v, 2, int)),
+}
+
+async def do_set(mc, cmds, json_output):
+    argnum = 2
+    ensure_self_info.fresh_until = 0 # node params may change
+    match cmds[1]:
+        case "help" :
+            argnum = 1
+            print("""Available parameters :
     pin <pin>                   : ble pin
     radio <freq,bw,sf,cr>       : radio params
     tuning <rx_dly,af>          : tuning params
@@ -1256,207 +1412,103 @@ async def next_cmd(mc, cmds, json_output=False):
     print_adverts <on/off>      : display adverts as they come
     print_new_contacts <on/off> : display new pending contacts when available
     print_path_updates <on/off> : display path updates as they come""")
-                    case "max_flood_attempts":
-                        msg_ack.max_flood_attempts=int(cmds[2])
-                    case "max_attempts":
-                        msg_ack.max_attempts=int(cmds[2])
-                    case "flood_after":
-                        msg_ack.flood_after=int(cmds[2])
-                    case "print_name":
-                        interactive_loop.print_name = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "classic_prompt":
-                        interactive_loop.classic = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "color" :
-                        process_event_message.color = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "print_snr" :
-                        process_event_message.print_snr = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "print_adverts" :
-                        handle_advert.print_adverts = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "print_path_updates" :
-                        handle_path_update.print_path_updates = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "print_new_contacts" :
-                        handle_new_contact.print_new_contacts = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "json_msgs" :
-                        handle_message.json_output = (cmds[2] == "on")
-                        if json_output :
-                            print(json.dumps({"cmd" : cmds[1], "param" : cmds[2]}))
-                    case "pin":
-                        res = await mc.commands.set_devicepin(cmds[2])
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "radio":
-                        params=cmds[2].split(",")
-                        res=await mc.commands.set_radio(params[0], params[1], params[2], params[3])
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "name":
-                        res = await mc.commands.set_name(cmds[2])
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "tx":
-                        res = await mc.commands.set_tx_power(cmds[2])
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "lat":
-                        if "adv_lon" in mc.self_info :
-                            lon = mc.self_info['adv_lon']
-                        else:
-                            lon = 0
-                        lat = float(cmds[2])
-                        res = await mc.commands.set_coords(lat, lon)
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "lon":
-                        if "adv_lat" in mc.self_info :
-                            lat = mc.self_info['adv_lat']
-                        else:
-                            lat = 0
-                        lon = float(cmds[2])
-                        res = await mc.commands.set_coords(lat, lon)
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "coords":
-                        params=cmds[2].split(",")
-                        res = await mc.commands.set_coords(\
-                                float(params[0]),\
-                                float(params[1]))
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "tuning":
-                        params=cmds[2].commands.split(",")
-                        res = await mc.commands.set_tuning(
-                            int(params[0]), int(params[1]))
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print("ok")
-                    case "manual_add_contacts":
-                        mac = (cmds[2] == "on") or (cmds[2] == "true") or (cmds[2] == "yes") or (cmds[2] == "1")
-                        res = await mc.commands.set_manual_add_contacts(mac)
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        else :
-                            print(f"manual add contact: {mac}")
-                    case "auto_update_contacts":
-                        auc = (cmds[2] == "on") or (cmds[2] == "true") or (cmds[2] == "yes") or (cmds[2] == "1")
-                        mc.auto_update_contacts=auc
-                    case "telemetry_mode_base":
-                        if (cmds[2] == "2") or (cmds[2] == "all") or (cmds[2] == "yes") or (cmds[2] == "on") :
-                            mode = 2
-                        elif (cmds[2] == "1") or (cmds[2] == "selected") or (cmds[2] == "dev") :
-                            mode = 1
-                        else :
-                            mode = 0
-                        res = await mc.commands.set_telemetry_mode_base(mode)
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        else:
-                            print(f"telemetry mode: {mode}")
-                    case "telemetry_mode_loc":
-                        if (cmds[2] == "2") or (cmds[2].startswith("al")) or (cmds[2] == "yes") or (cmds[2] == "on") :
-                            mode = 2
-                        elif (cmds[2] == "1") or (cmds[2] == "selected") or (cmds[2].startswith("dev")) :
-                            mode = 1
-                        else :
-                            mode = 0
-                        res = await mc.commands.set_telemetry_mode_loc(mode)
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        else:
-                            print(f"telemetry mode for location: {mode}")
-                    case "telemetry_mode_env":
-                        if (cmds[2] == "2") or (cmds[2].startswith("al")) or (cmds[2] == "yes") or (cmds[2] == "on") :
-                            mode = 2
-                        elif (cmds[2] == "1") or (cmds[2] == "selected") or (cmds[2].startswith("dev")) :
-                            mode = 1
-                        else :
-                            mode = 0
-                        res = await mc.commands.set_telemetry_mode_env(mode)
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        else:
-                            print(f"telemetry mode for env: {mode}")
-                    case "advert_loc_policy":
-                        if (cmds[2] == "1") or (cmds[2] == "share") :
-                            policy = 1
-                        else :
-                            policy = 0
-                        res = await mc.commands.set_advert_loc_policy(policy)
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        else:
-                            print(f"Policy for adv_loc: {policy}")
-
-                    case _: # custom var
-                        if cmds[1].startswith("_") :
-                            vname = cmds[1][1:]
-                        else:
-                            vname = cmds[1]
-                        res = await mc.commands.set_custom_var(vname, cmds[2])
-                        if res.type == EventType.ERROR:
-                            print(f"Error : {res}")
-                        elif json_output :
-                            print(json.dumps({"result" : "set", "var" : vname, "value" : cmds[2]}))
-                        else :
-                            print(f"Var {vname} set to {cmds[2]}")
-
-            case "get" :
-                argnum = 1
-                match cmds[1]:
-                    case "help":
-                        print("""Gets parameters from node
+        case "max_flood_attempts":
+            msg_ack.max_flood_attempts=int(cmds[2])
+        case "max_attempts":
+            msg_ack.max_attempts=int(cmds[2])
+        case "flood_after":
+            msg_ack.flood_after=int(cmds[2])
+        case setting if setting in DISPLAY_SETTINGS :
+            func, attr = DISPLAY_SETTINGS[setting]
+            setattr(func, attr, cmds[2] == "on")
+            if json_output :
+                print_json({"cmd" : cmds[1], "param" : cmds[2]})
+        case param if param in NODE_PARAMS :
+            method, parse = NODE_PARAMS[param]
+            res = await getattr(mc.commands, method)(*parse(mc, cmds[2]))
+            logger.debug(res)
+            print_result(res, json_output, ok="ok")
+        case "manual_add_contacts":
+            mac = cmds[2] in ON_VALUES
+            res = await mc.commands.set_manual_add_contacts(mac)
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            else :
+                print(f"manual add contact: {mac}")
+        case "auto_update_contacts":
+            auc = cmds[2] in ON_VALUES
+            mc.auto_update_contacts=auc
+        case "telemetry_mode_base":
+            if cmds[2] in TELEMETRY_MODE_ALL :
+                mode = 2
+            elif cmds[2] in TELEMETRY_MODE_SELECTED :
+                mode = 1
+            else :
+                mode = 0
+            res = await mc.commands.set_telemetry_mode_base(mode)
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            else:
+                print(f"telemetry mode: {mode}")
+        case "telemetry_mode_loc":
+            if cmds[2] in TELEMETRY_MODE_ALL or cmds[2][:2] == "al" :
+                mode = 2
+            elif cmds[2] in TELEMETRY_MODE_SELECTED or cmds[2][:3] == "dev" :
+                mode = 1
+            else :
+                mode = 0
+            res = await mc.commands.set_telemetry_mode_loc(mode)
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            else:
+                print(f"telemetry mode for location: {mode}")
+        case "telemetry_mode_env":
+            if cmds[2] in TELEMETRY_MODE_ALL or cmds[2][:2] == "al" :
+                mode = 2
+            elif cmds[2] in TELEMETRY_MODE_SELECTED or cmds[2][:3] == "dev" :
+                mode = 1
+            else :
+                mode = 0
+            res = await mc.commands.set_telemetry_mode_env(mode)
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            else:
+                print(f"telemetry mode for env: {mode}")
+        case "advert_loc_policy":
+            if cmds[2] in ("1", "share") :
+                policy = 1
+            else :
+                policy = 0
+            res = await mc.commands.set_advert_loc_policy(policy)
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            else:
+                print(f"Policy for adv_loc: {policy}")
+
+        case _: # custom var
+            vname = cmds[1][1:] if cmds[1][:1] == "_" else cmds[1]
+            res = await mc.commands.set_custom_var(vname, cmds[2])
+            if res.type == EventType.ERROR:
+                print(f"Error : {res}")
+            elif json_output :
+                print_json({"result" : "set", "var" : vname, "value" : cmds[2]})
+            else :
+                print(f"Var {vname} set to {cmds[2]}")
+    return argnum
+
+# node params for get read from self_info : name -> self_info key
+SELF_INFO_PARAMS = {
+    "manual_add_contacts" : "manual_add_contacts",
+    "telemetry_mode_base" : "telemetry_mode_base",
+    "telemetry_mode_loc" : "telemetry_mode_loc",
+    "telemetry_mode_env" : "telemetry_mode_env",
+    "advert_loc_policy" : "adv_loc_policy",
+}
+
+async def do_get(mc, cmds, json_output):
+    match cmds[1]:
+        case "help":
+            print("""Gets parameters from node
     name               : node name
     bat                : battery level in mV
     fstats             : fs statistics
@@ -1471,953 +1523,914 @@ async def next_cmd(mc, cmds, json_output=False):
     print_path_updates : display path updates as they come
     custom             : all custom variables in json format
                 each custom var can also be get/set directly""")
-                    case "max_flood_attempts":
-                        if json_output :
-                            print(json.dumps({"max_flood_attempts" : msg_ack.max_flood_attempts}))
-                        else:
-                            print(f"max_flood_attempts: {msg_ack.max_flood_attempts}")
-                    case "flood_after":
-                        if json_output :
-                            print(json.dumps({"flood_after" : msg_ack.flood_after}))
-                        else:
-                            print(f"flood_after: {msg_ack.flood_after}")
-                    case "print_name":
-                        if json_output :
-                            print(json.dumps({"print_name" : interactive_loop.print_name}))
-                        else:
-                            print(f"{'on' if interactive_loop.print_name else 'off'}")
-                    case "classic_prompt":
-                        if json_output :
-                            print(json.dumps({"classic_prompt" : interactive_loop.classic}))
-                        else:
-                            print(f"{'on' if interactive_loop.classic else 'off'}")
-                    case "json_msgs":
-                        if json_output :
-                            print(json.dumps({"json_msgs" : handle_message.json_output}))
-                        else:
-                            print(f"{'on' if handle_message.json_output else 'off'}")
-                    case "color":
-                        if json_output :
-                            print(json.dumps({"color" : process_event_message.color}))
-                        else:
-                            print(f"{'on' if process_event_message.color else 'off'}")
-                    case "print_adverts":
-                        if json_output :
-                            print(json.dumps({"print_adverts" : handle_advert.print_adverts}))
-                        else:
-                            print(f"{'on' if handle_advert.print_adverts else 'off'}")
-                    case "print_path_updates":
-                        if json_output :
-                            print(json.dumps({"print_path_updates" : handle_path_update.print_path_updates}))
-                        else:
-                            print(f"{'on' if handle_path_update.print_path_updates else 'off'}")
-                    case "print_new_contacts":
-                        if json_output :
-                            print(json.dumps({"print_new_contacts" : handle_new_contact.print_new_contacts}))
-                        else:
-                            print(f"{'on' if handle_new_contact.print_new_contacts else 'off'}")
-                    case "print_snr":
-                        if json_output :
-                            print(json.dumps({"print_snr" : process_event_message.print_snr}))
-                        else:
-                            print(f"{'on' if process_event_message.print_snr else 'off'}")
-                    case "name":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps(mc.self_info["name"]))
-                        else:
-                            print(mc.self_info["name"])
-                    case "tx":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps(mc.self_info["tx_power"]))
-                        else:
-                            print(mc.self_info["tx_power"])
-                    case "coords":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"lat": mc.self_info["adv_lat"], "lon":mc.self_info["adv_lon"]}))
-                        else:
-                            print(f"{mc.self_info['adv_lat']},{mc.self_info['adv_lon']}")
-                    case "lat":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"lat": mc.self_info["adv_lat"]}))
-                        else:
-                            print(f"{mc.self_info['adv_lat']}")
-                    case "lon":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"lon": mc.self_info["adv_lon"]}))
-                        else:
-                            print(f"{mc.self_info['adv_lon']}")
-                    case "radio":
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps(
-                            {"radio_freq": mc.self_info["radio_freq"],
-                                "radio_bw":   mc.self_info["radio_bw"],
-                                "radio_sf":   mc.self_info["radio_sf"],
-                                "radio_cr":   mc.self_info["radio_cr"]}))
-                        else:
-                            print(f"{mc.self_info['radio_freq']},{mc.self_info['radio_bw']},{mc.self_info['radio_sf']},{mc.self_info['radio_cr']}")
-                    case "bat" :
-                        res = await mc.commands.get_bat()
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error getting bat {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print(f"Battery level : {res.payload['level']}")
-                    case "fstats" :
-                        res = await mc.commands.get_bat()
-                        logger.debug(res)
-                        if res.type == EventType.ERROR or not "used_kb" in res.payload:
-                            print(f"Error getting fs stats {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        else:
-                            print(f"Using {res.payload['used_kb']}kB of {res.payload['total_kb']}kB")
-                    case "manual_add_contacts" :
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"manual_add_contacts" : mc.self_info["manual_add_contacts"]}))
-                        else :
-                            print(f"manual_add_contacts: {mc.self_info['manual_add_contacts']}")
-                    case "telemetry_mode_base" :
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"telemetry_mode_base" : mc.self_info["telemetry_mode_base"]}))
-                        else :
-                            print(f"telemetry_mode_base: {mc.self_info['telemetry_mode_base']}")
-                    case "telemetry_mode_loc" :
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"telemetry_mode_loc" : mc.self_info["telemetry_mode_loc"]}))
-                        else :
-                            print(f"telemetry_mode_loc: {mc.self_info['telemetry_mode_loc']}")
-                    case "telemetry_mode_env" :
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"telemetry_mode_env" : mc.self_info["telemetry_mode_env"]}))
-                        else :
-                            print(f"telemetry_mode_env: {mc.self_info['telemetry_mode_env']}")
-                    case "advert_loc_policy" :
-                        await mc.commands.send_appstart()
-                        if json_output :
-                            print(json.dumps({"advert_loc_policy" : mc.self_info["adv_loc_policy"]}))
-                        else :
-                            print(f"advert_loc_policy: {mc.self_info['adv_loc_policy']}")
-                    case "auto_update_contacts" :
-                        if json_output :
-                            print(json.dumps({"auto_update_contacts" : mc.auto_update_contacts}))
-                        else :
-                            print(f"auto_update_contacts: {'on' if mc.auto_update_contacts else 'off'}")
-                    case "custom" :
-                        res = await mc.commands.get_custom_vars()
-                        logger.debug(res)
-                        if res.type == EventType.ERROR :
-                            if json_output :
-                                print(json.dumps(res))
-                            else :
-                                logger.error("Couldn't get custom variables")
-                        else :
-                            print(json.dumps(res.payload, indent=4))
-                    case _ :
-                        res = await mc.commands.get_custom_vars()
-                        logger.debug(res)
-                        if res.type == EventType.ERROR :
-                            if json_output :
-                                print(json.dumps(res))
-                            else :
-                                logger.error(f"Couldn't get custom variables")
-                        else :
-                            try:
-                                if cmds[1].startswith("_"):
-                                    vname = cmds[1][1:]
-                                else:
-                                    vname = cmds[1]
-                                val = res.payload[vname]
-                            except KeyError:
-                                if json_output :
-                                    print(json.dumps({"error" : "Unknown var", "var" : cmds[1]}))
-                                else :
-                                    print(f"Unknown var {cmds[1]}")
-                            else:
-                                if json_output :
-                                    print(json.dumps({"var" : vname, "value" : val}))
-                                else:
-                                    print(val)
-
-            case "self_telemetry" | "t":
-                res = await mc.commands.get_self_telemetry()
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error while requesting telemetry")
-                elif res is None:
-                    if json_output :
-                        print(json.dumps({"error" : "Timeout waiting telemetry"}))
-                    else:
-                        print("Timeout waiting telemetry")
+        case "max_flood_attempts":
+            if json_output :
+                print_json({"max_flood_attempts" : msg_ack.max_flood_attempts})
+            else:
+                print(f"max_flood_attempts: {msg_ack.max_flood_attempts}")
+        case "flood_after":
+            if json_output :
+                print_json({"flood_after" : msg_ack.flood_after})
+            else:
+                print(f"flood_after: {msg_ack.flood_after}")
+        case setting if setting in DISPLAY_SETTINGS :
+            func, attr = DISPLAY_SETTINGS[setting]
+            value = getattr(func, attr)
+            if json_output :
+                print_json({setting : value})
+            else:
+                print(f"{'on' if value else 'off'}")
+        case "name":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json(mc.self_info["name"])
+            else:
+                print(mc.self_info["name"])
+        case "tx":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json(mc.self_info["tx_power"])
+            else:
+                print(mc.self_info["tx_power"])
+        case "coords":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json({"lat": mc.self_info["adv_lat"], "lon":mc.self_info["adv_lon"]})
+            else:
+                print(f"{mc.self_info['adv_lat']},{mc.self_info['adv_lon']}")
+        case "lat":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json({"lat": mc.self_info["adv_lat"]})
+            else:
+                print(f"{mc.self_info['adv_lat']}")
+        case "lon":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json({"lon": mc.self_info["adv_lon"]})
+            else:
+                print(f"{mc.self_info['adv_lon']}")
+        case "radio":
+            await ensure_self_info(mc)
+            if json_output :
+                print_json(
+                {"radio_freq": mc.self_info["radio_freq"],
+                    "radio_bw":   mc.self_info["radio_bw"],
+                    "radio_sf":   mc.self_info["radio_sf"],
+                    "radio_cr":   mc.self_info["radio_cr"]})
+            else:
+                print(f"{mc.self_info['radio_freq']},{mc.self_info['radio_bw']},{mc.self_info['radio_sf']},{mc.self_info['radio_cr']}")
+        case "bat" :
+            res = await mc.commands.get_bat()
+            logger.debug(res)
+            if res.type == EventType.ERROR:
+                print(f"Error getting bat {res}")
+            elif json_output :
+                print_json(res.payload)
+            else:
+                print(f"Battery level : {res.payload['level']}")
+        case "fstats" :
+            res = await mc.commands.get_bat()
+            logger.debug(res)
+            if res.type == EventType.ERROR or not "used_kb" in res.payload:
+                print(f"Error getting fs stats {res}")
+            elif json_output :
+                print_json(res.payload)
+            else:
+                print(f"Using {res.payload['used_kb']}kB of {res.payload['total_kb']}kB")
+        case param if param in SELF_INFO_PARAMS :
+            await ensure_self_info(mc)
+            value = mc.self_info[SELF_INFO_PARAMS[param]]
+            if json_output :
+                print_json({param : value})
+            else :
+                print(f"{param}: {value}")
+        case "auto_update_contacts" :
+            if json_output :
+                print_json({"auto_update_contacts" : mc.auto_update_contacts})
+            else :
+                print(f"auto_update_contacts: {'on' if mc.auto_update_contacts else 'off'}")
+        case "custom" :
+            res = await mc.commands.get_custom_vars()
+            logger.debug(res)
+            if res.type == EventType.ERROR :
+                if json_output :
+                    print_json(res)
                 else :
-                    print(json.dumps(res.payload, indent=4))
-
-            case "get_channel":
-                argnum = 1
-                res = await get_channel(mc, cmds[1])
-                if res is None:
-                    print(f"Error while requesting channel info")
-                else:
-                    print(res)
-
-            case "get_channels"|"gc":
-                res = await get_channels(mc)
-                if json_output:
-                    print(json.dumps(res))
-                else:
-                    for c in mc.channels:
-                        if c["channel_name"] != "":
-                            print(f"{c['channel_idx']}: {c['channel_name']} [{c['channel_secret']}]")
-
-            case "set_channel":
-                argnum = 3
-                if cmds[2].startswith("#") or len(cmds) == 3:
-                    argnum = 2
-                    res = await set_channel(mc, cmds[1], cmds[2])
-                elif len(cmds[3]) != 32:
-                    res = None
-                else: 
-                    res = await set_channel(mc, cmds[1], cmds[2], bytes.fromhex(cmds[3]))
-                if res is None:
-                    print("Error setting channel")
-
-            case "remove_channel":
-                argnum = 1
-                res = await set_channel(mc, cmds[1], "", bytes.fromhex(16*"00"))
-                if res is None:
-                    print("Error deleting channel")
-
-            case "reboot" :
-                res = await mc.commands.reboot()
-                logger.debug(res)
+                    logger.error("Couldn't get custom variables")
+            else :
+                print_json(res.payload, indent=True)
+        case _ :
+            res = await mc.commands.get_custom_vars()
+            logger.debug(res)
+            if res.type == EventType.ERROR :
                 if json_output :
-                    print(json.dumps(res.payload, indent=4))
-
-            case "msg" | "m" | "{" : # sends to a contact from name
-                argnum = 2
-                dest = None
-                
-                if len(cmds[1]) == 12: # possibly an hex prefix 
-                    try:
-                        dest = bytes.fromhex(cmds[1])
-                    except ValueError:
-                        dest = None
-
-                if dest is None:
-                    await mc.ensure_contacts()
-                    dest = mc.get_contact_by_name(cmds[1])
-
-                if dest is None:
-                    if json_output :
-                        print(json.dumps({"error" : "unknown destination", "dest" : cmds[1]}))
-                    else:
-                        print(f"Unknown destination {cmds[1]}")
-
+                    print_json(res)
                 else :
-                    res = await send_msg(mc, dest, cmds[2])
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error sending message: {res}")
-                    elif json_output :
-                        print(json.dumps(res.payload, indent=4))
-
-            case "chan"|"ch" :
-                argnum = 2
-                if cmds[1].isnumeric() :
-                    nb = int(cmds[1])
-                else:
-                    nb = get_channel_by_name(mc, cmds[1])['channel_idx']
-                res = await send_chan_msg(mc, nb, cmds[2])
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error sending message: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
-
-            case "public" | "dch" : # default chan
-                argnum = 1
-                res = await send_chan_msg(mc, 0, cmds[1])
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error sending message: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
-
-            case "cmd" | "c" | "[" :
-                argnum = 2
-                dest = None
-
-                if len(cmds[1]) == 12: # possibly an hex prefix 
-                    try:
-                        dest = bytes.fromhex(cmds[1])
-                    except ValueError:
-                        dest = None
-
-                if dest is None:
-                    await mc.ensure_contacts()
-                    dest = mc.get_contact_by_name(cmds[1])
-
-                if dest is None:
+                    logger.error(f"Couldn't get custom variables")
+            else :
+                try:
+                    vname = cmds[1][1:] if cmds[1][:1] == "_" else cmds[1]
+                    val = res.payload[vname]
+                except KeyError:
                     if json_output :
-                        print(json.dumps({"error" : "contact destination", "dest" : cmds[1]}))
-                    else:
-                        print(f"Unknown destination {cmds[1]}")
-
+                        print_json({"error" : "Unknown var", "var" : cmds[1]})
+                    else :
+                        print(f"Unknown var {cmds[1]}")
                 else:
-                    res = await send_cmd(mc, dest, cmds[2])
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error sending cmd: {res}")
-                    elif json_output :
-                        print(res.payload)
-                        print(json.dumps(res.payload, indent=4))
-
-            case "trace" | "tr":
-                argnum = 1
-                res = await mc.commands.send_trace(path=cmds[1])
-                if res and res.type != EventType.ERROR:
-                    tag= int.from_bytes(res.payload['expected_ack'], byteorder="little")
-                    timeout = res.payload["suggested_timeout"] / 1000 * 1.2
-                    ev = await mc.wait_for_event(EventType.TRACE_DATA, 
-                        attribute_filters={"tag": tag},
-                        timeout=timeout)
-                    if ev is None:
-                        if json_output:
-                            print(json.dumps({"error" : "timeout waiting trace"}))
-                        else :
-                            print(f"Timeout waiting trace for path {cmds[1]}")
-                    elif ev.type == EventType.ERROR:
-                        if json_output:
-                            print(json.dumps(ev.payload))
-                        else :
-                            print("Error waiting trace")
-                    else:
-                        if json_output:
-                            print(json.dumps(ev.payload, indent=2))
-                        else :
-                            classic = interactive_loop.classic or not process_event_message.color
-                            print("]",end="")
-                            for t in ev.payload["path"]:
-                                if classic :
-                                    print("→",end="")
-                                else:
-                                    print(f" {ANSI_INVERT}", end="")
-                                snr = t['snr']
-                                if snr >= 10 :
-                                    print(ANSI_BGREEN, end="")
-                                elif snr <= 0:
-                                    print(ANSI_BRED, end="")
-                                else :
-                                    print(ANSI_BGRAY, end="")
-                                print(f"{snr:.2f}",end="")
-                                if classic :
-                                    print("→",end="")
-                                else :
-                                    print(f"{ANSI_NORMAL}🭬",end="")
-                                print(ANSI_END, end="")
-                                if "hash" in t:
-                                    print(f"[{t['hash']}]",end="")
-                                else:
-                                    print("[")
-
-            case "login" | "l" :
-                argnum = 2
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
                     if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
+                        print_json({"var" : vname, "value" : val})
                     else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.send_login(contact, cmds[2])
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        if json_output :
-                            print(json.dumps({"error" : "Error while login"}))
-                        else:
-                            print(f"Error while loging: {res}")
-                    else: # should probably wait for the good ack
-                        timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
-                        res = await mc.wait_for_event(EventType.LOGIN_SUCCESS, timeout=timeout)
-                        logger.debug(res)
-                        if res is None:
-                            print("Login failed : Timeout waiting response")
-                        elif json_output :
-                            if res.type == EventType.LOGIN_SUCCESS:
-                                print(json.dumps({"login_success" : True}, indent=4))
-                            else:
-                                print(json.dumps({"login_success" : False, "error" : "login failed"}, indent=4))
-                        else:
-                            if res.type == EventType.LOGIN_SUCCESS:
-                                print("Login success")
-                            else:
-                                print("Login failed")
-
-            case "logout" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                res = await mc.commands.send_logout(contact)
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error while logout: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload))
-                else:
-                    print("Logout ok")
+                        print(val)
+    return 1
 
-            case "contact_timeout" :
-                argnum = 2
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                contact["timeout"] = float(cmds[2])
+async def do_self_telemetry(mc, cmds, json_output):
+    res = await mc.commands.get_self_telemetry()
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        print(f"Error while requesting telemetry")
+    elif res is None:
+        if json_output :
+            print_json({"error" : "Timeout waiting telemetry"})
+        else:
+            print("Timeout waiting telemetry")
+    else :
+        print_json(res.payload, indent=True)
+    return 0
 
-            case "req_status" | "rs" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                res = await mc.commands.send_statusreq(contact)
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error while requesting status: {res}")
-                else :
-                    timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
-                    res = await mc.wait_for_event(EventType.STATUS_RESPONSE, timeout=timeout)
-                    logger.debug(res)
-                    if res is None:
-                        if json_output :
-                            print(json.dumps({"error" : "Timeout waiting status"}))
-                        else:
-                            print("Timeout waiting status")
-                    else :
-                        print(json.dumps(res.payload, indent=4))
-
-            case "req_telemetry" | "rt" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                res = await mc.commands.send_telemetry_req(contact)
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error while requesting telemetry")
-                else:
-                    timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
-                    res = await mc.wait_for_event(EventType.TELEMETRY_RESPONSE, timeout=timeout)
-                    logger.debug(res)
-                    if res is None:
-                        if json_output :
-                            print(json.dumps({"error" : "Timeout waiting telemetry"}))
-                        else:
-                            print("Timeout waiting telemetry")
-                    else :
-                        print(json.dumps(res.payload, indent=4))
-        
-            case "disc_path" | "dp" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                res = await discover_path(mc, contact)
-                if res is None:
-                    print(f"Error while discovering path")
-                else:
-                    if json_output :
-                        print(json.dumps(res, indent=4))
-                    else:
-                        if "error" in res :
-                            print("Timeout while discovering path")
-                        else:
-                            outp = res['out_path']
-                            outp = outp if outp != "" else "direct"
-                            inp = res['in_path']
-                            inp = inp if inp != "" else "direct"
-                            print(f"Path for {contact['adv_name']}: out {outp}, in {inp}")
-
-            case "req_btelemetry"|"rbt" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                timeout = 0 if not "timeout" in contact else contact["timeout"]
-                res = await mc.commands.req_telemetry_sync(contact, timeout)
-                if res is None :
-                    if json_output :
-                        print(json.dumps({"error" : "Getting data"}))
-                    else:
-                        print("Error getting data")
-                else :
-                    print(json.dumps(res))
-
-            case "req_bstatus"|"rbs" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                timeout = 0 if not "timeout" in contact else contact["timeout"]
-                res = await mc.commands.req_status_sync(contact, timeout)
-                if res is None :
-                    if json_output :
-                        print(json.dumps({"error" : "Getting data"}))
-                    else:
-                        print("Error getting data")
-                else :
-                    print(json.dumps(res, indent=4))
-
-            case "req_mma" | "rm":
-                argnum = 3
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if cmds[2][-1] == "s":
-                    from_secs = int(cmds[2][0:-1])
-                elif cmds[2][-1] == "m":
-                    from_secs = int(cmds[2][0:-1]) * 60
-                elif cmds[2][-1] == "h":
-                    from_secs = int(cmds[2][0:-1]) * 3600
-                else :
-                    from_secs = int(cmds[2]) * 60 # same as tdeck
-                if cmds[3][-1] == "s":
-                    to_secs = int(cmds[3][0:-1])
-                elif cmds[3][-1] == "m":
-                    to_secs = int(cmds[3][0:-1]) * 60
-                elif cmds[3][-1] == "h":
-                    to_secs = int(cmds[3][0:-1]) * 3600
-                else :
-                    to_secs = int(cmds[3]) * 60
-                timeout = 0 if not "timeout" in contact else contact["timeout"]
-                res = await mc.commands.req_mma_sync(contact, from_secs, to_secs, timeout)
-                if res is None :
-                    if json_output :
-                        print(json.dumps({"error" : "Getting data"}))
-                    else:
-                        print("Error getting data")
-                else :
-                    print(json.dumps(res, indent=4))
-
-            case "req_acl" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                timeout = 0 if not "timeout" in contact else contact["timeout"]
-                res = await mc.commands.req_acl_sync(contact, timeout)
-                if res is None :
-                    if json_output :
-                        print(json.dumps({"error" : "Getting data"}))
-                    else:
-                        print("Error getting data")
-                else :
-                    if json_output:
-                        print(json.dumps(res, indent=4))
-                    else:
-                        for e in res:
-                            name = e['key']
-                            ct = mc.get_contact_by_key_prefix(e['key'])
-                            if ct is None:
-                                if mc.self_info["public_key"].startswith(e['key']):
-                                    name = f"{'self':<20} [{e['key']}]"
-                            else:
-                                name = f"{ct['adv_name']:<20} [{e['key']}]"
-                            print(f"{name:{' '}<35}: {e['perm']:02x}")
-
-            case "req_binary" :
-                argnum = 2
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                timeout = 0 if not "timeout" in contact else contact["timeout"]
-                res = await mc.commands.req_binary(contact, bytes.fromhex(cmds[2]), timeout)
-                if res is None :
-                    if json_output :
-                        print(json.dumps({"error" : "Getting binary data"}))
-                    else:
-                        print("Error getting binary data")
-                else :
-                    print(json.dumps(res))
+async def do_get_channel(mc, cmds, json_output):
+    res = await get_channel(mc, cmds[1])
+    if res is None:
+        print(f"Error while requesting channel info")
+    else:
+        print(res)
+    return 1
 
-            case "contacts" | "list" | "lc":
-                await mc.ensure_contacts(follow=True)
-                res = mc.contacts
-                if json_output :
-                    print(json.dumps(res, indent=4))
-                else :
-                    for c in res.items():
-                        print(c[1]["adv_name"])
-                    print(f"> {len(mc.contacts)} contacts in device")
+async def do_get_channels(mc, cmds, json_output):
+    res = await get_channels(mc)
+    if json_output:
+        print_json(res)
+    else:
+        for c in mc.channels:
+            if c["channel_name"] != "":
+                print(f"{c['channel_idx']}: {c['channel_name']} [{c['channel_secret']}]")
+    return 0
+
+async def do_set_channel(mc, cmds, json_output):
+    argnum = 3
+    if cmds[2].startswith("#") or len(cmds) == 3:
+        argnum = 2
+        res = await set_channel(mc, cmds[1], cmds[2])
+    elif len(cmds[3]) != 32:
+        res = None
+    else: 
+        res = await set_channel(mc, cmds[1], cmds[2], bytes.fromhex(cmds[3]))
+    if res is None:
+        print("Error setting channel")
+    return argnum
+
+async def do_remove_channel(mc, cmds, json_output):
+    res = await set_channel(mc, cmds[1], "", bytes.fromhex(16*"00"))
+    if res is None:
+        print("Error deleting channel")
+    return 1
+
+async def do_reboot(mc, cmds, json_output):
+    ensure_self_info.fresh_until = 0 # node will come back with its stored params
+    res = await mc.commands.reboot()
+    logger.debug(res)
+    if json_output :
+        print_json(res.payload)
+    return 0
+
+async def do_msg(mc, cmds, json_output): # sends to a contact from name
+    dest = None
+
+    if len(cmds[1]) == 12: # possibly an hex prefix 
+        try:
+            dest = bytes.fromhex(cmds[1])
+        except ValueError:
+            dest = None
+
+    if dest is None:
+        await mc.ensure_contacts()
+        dest = get_contact_by_name(mc, cmds[1])
 
-            case "reload_contacts" | "rc":
-                await mc.commands.get_contacts()
-                res = mc.contacts
-                if json_output :
-                    print(json.dumps(res, indent=4))
-                else :
-                    for c in res.items():
-                        print(c[1]["adv_name"])
-                    print(f"> {len(mc.contacts)} contacts in device")
+    if dest is None:
+        if json_output :
+            print_json({"error" : "unknown destination", "dest" : cmds[1]})
+        else:
+            print(f"Unknown destination {cmds[1]}")
 
-            case "pending_contacts":
-                if json_output:
-                    print(json.dumps(mc.pending_contacts, indent=4))
-                else:
-                    for c in mc.pending_contacts.items():
-                        print(f"{c[1]['adv_name']}: {c[1]['public_key']}")
-
-            case "flush_pending":
-                mc.flush_pending_contacts()
-
-            case "add_pending":
-                argnum = 1
-                contact = mc.pop_pending_contact(cmds[1])
-                if contact is None:
-                    if json_output:
-                        print(json.dumps({"error":"Contact does not exist"}))
-                    else:
-                        logger.error(f"Contact {cmds[1]} does not exist")
-                else:
-                    res = await mc.commands.add_contact(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error adding contact: {res}")
-                    else:
-                        mc.contacts[contact["public_key"]]=contact
-                        if json_output :
-                            print(json.dumps(res.payload, indent=4))
-
-            case "path":
-                argnum = 1
-                res = await mc.ensure_contacts(follow=True)
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    path = contact["out_path"]
-                    path_len = contact["out_path_len"]
-                    if json_output :
-                        print(json.dumps({"adv_name" : contact["adv_name"],
-                                          "out_path_len" : path_len,
-                                          "out_path" : path}))
-                    else:
-                        if (path_len == 0) :
-                            print("0 hop")
-                        elif (path_len == -1) :
-                            print("Path not set")
-                        else:
-                            print(path)
+    else :
+        res = await send_msg(mc, dest, cmds[2])
+        logger.debug(res)
+        print_result(res, json_output, "Error sending message")
+    return 2
+
+async def do_chan(mc, cmds, json_output):
+    if cmds[1].isnumeric() :
+        nb = int(cmds[1])
+    else:
+        nb = get_channel_by_name(mc, cmds[1])['channel_idx']
+    res = await send_chan_msg(mc, nb, cmds[2])
+    logger.debug(res)
+    print_result(res, json_output, "Error sending message")
+    return 2
+
+async def do_public(mc, cmds, json_output): # default chan
+    res = await send_chan_msg(mc, 0, cmds[1])
+    logger.debug(res)
+    print_result(res, json_output, "Error sending message")
+    return 1
+
+async def do_cmd(mc, cmds, json_output):
+    dest = None
+
+    if len(cmds[1]) == 12: # possibly an hex prefix 
+        try:
+            dest = bytes.fromhex(cmds[1])
+        except ValueError:
+            dest = None
+
+    if dest is None:
+        await mc.ensure_contacts()
+        dest = get_contact_by_name(mc, cmds[1])
 
-            case "contact_info" | "ci":
-                argnum = 1
-                res = await mc.ensure_contacts(follow=True)
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    print(json.dumps(contact, indent=4))
+    if dest is None:
+        if json_output :
+            print_json({"error" : "contact destination", "dest" : cmds[1]})
+        else:
+            print(f"Unknown destination {cmds[1]}")
 
-            case "change_path" | "cp":
-                argnum = 2
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    path = cmds[2].replace(",","") # we'll accept path with ,
-                    try:
-                        res = await mc.commands.change_contact_path(contact, path)
-                        logger.debug(res)
-                        if res.type == EventType.ERROR:
-                            print(f"Error setting path: {res}")
-                        elif json_output :
-                            print(json.dumps(res.payload, indent=4))
-                    except ValueError:
-                        print(f"Bad path format {cmds[2]}")
-
-            case "change_flags" | "cf":
-                argnum = 2
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.change_contact_flags(contact, int(cmds[2]))
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error setting path: {res}")
-                    elif json_output :
-                        print(json.dumps(res.payload, indent=4))
-
-            case "reset_path" | "rp" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.reset_path(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error resetting path: {res}")
-                    else:
-                        if json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        contact["out_path"] = ""
-                        contact["out_path_len"] = -1
-
-            case "share_contact" | "sc":
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.share_contact(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error while sharing contact: {res}")
-                    elif json_output :
-                        print(json.dumps(res.payload, indent=4))
-
-            case "export_contact"|"ec":
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.export_contact(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error exporting contact: {res}")
-                    else:
-                        if json_output :
-                            print(json.dumps(res.payload))
-                        else :
-                            print(res.payload['uri'])
-
-            case "import_contact"|"ic":
-                argnum = 1
-                if cmds[1].startswith("meshcore://") :
-                    res = await mc.commands.import_contact(bytes.fromhex(cmds[1][11:]))
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error while importing contact: {res}")
-                    else:
-                        logger.info("Contact successfully added")
-                        await mc.commands.get_contacts()
-
-            case "upload_contact" | "uc" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
+    else:
+        res = await send_cmd(mc, dest, cmds[2])
+        logger.debug(res)
+        print_result(res, json_output, "Error sending cmd")
+    return 2
+
+async def do_trace(mc, cmds, json_output):
+    res = await mc.commands.send_trace(path=cmds[1])
+    if res and res.type != EventType.ERROR:
+        tag= int.from_bytes(res.payload['expected_ack'], byteorder="little")
+        timeout = res.payload["suggested_timeout"] / 1000 * 1.2
+        ev = await mc.wait_for_event(EventType.TRACE_DATA, 
+            attribute_filters={"tag": tag},
+            timeout=timeout)
+        if ev is None:
+            if json_output:
+                print_json({"error" : "timeout waiting trace"})
+            else :
+                print(f"Timeout waiting trace for path {cmds[1]}")
+        elif ev.type == EventType.ERROR:
+            if json_output:
+                print_json(ev.payload)
+            else :
+                print("Error waiting trace")
+        else:
+            if json_output:
+                print_json(ev.payload)
+            else :
+                classic = interactive_loop.classic or not process_event_message.color
+                trace = ["]"] # built in one string, printed at once
+                for t in ev.payload["path"]:
+                    if classic :
+                        trace.append("→")
                     else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.export_contact(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error exporting contact: {res}")
+                        trace.append(f" {ANSI_INVERT}")
+                    snr = t['snr']
+                    if snr >= 10 :
+                        trace.append(ANSI_BGREEN)
+                    elif snr <= 0:
+                        trace.append(ANSI_BRED)
                     else :
-                        resp = requests.post("https://map.meshcore.dev/api/v1/nodes",
-                                            json = {"links": [res.payload['uri']]})
-                        if json_output :
-                            print(json.dumps({"response", str(resp)}))
-                        else :
-                            print(resp)
-
-            case "card" :
-                res = await mc.commands.export_contact()
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error exporting contact: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload))
-                else :
-                    print(res.payload['uri'])
-
-            case "upload_card" :
-                res = await mc.commands.export_contact()
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error exporting contact: {res}")
-                else :
-                    resp = requests.post("https://map.meshcore.dev/api/v1/nodes",
-                                         json = {"links": [res.payload['uri']]})
-                    if json_output :
-                        print(json.dumps({"response", str(resp)}))
+                        trace.append(ANSI_BGRAY)
+                    trace.append(f"{snr:.2f}")
+                    if classic :
+                        trace.append("→")
                     else :
-                        print(resp)
-
-            case "remove_contact" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                if contact is None:
-                    if json_output :
-                        print(json.dumps({"error" : "contact unknown", "name" : cmds[1]}))
-                    else:
-                        print(f"Unknown contact {cmds[1]}")
-                else:
-                    res = await mc.commands.remove_contact(contact)
-                    logger.debug(res)
-                    if res.type == EventType.ERROR:
-                        print(f"Error removing contact: {res}")
+                        trace.append(f"{ANSI_NORMAL}🭬")
+                    trace.append(ANSI_END)
+                    if "hash" in t:
+                        trace.append(f"[{t['hash']}]")
                     else:
-                        if json_output :
-                            print(json.dumps(res.payload, indent=4))
-                        del mc.contacts[contact["public_key"]]
-
-            case "recv" | "r" :
-                res = await mc.commands.get_msg()
-                logger.debug(res)
-                await process_event_message(mc, res, json_output)
-
-            case "sync_msgs" | "sm":
-                ret = True
-                first = True
-                if json_output :
-                    print("[", end="", flush=True)
-                    end=""
+                        trace.append("[\n")
+                print("".join(trace), end="")
+    return 1
+
+async def do_login(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if not contact is None:
+        res = await mc.commands.send_login(contact, cmds[2])
+        logger.debug(res)
+        if res.type == EventType.ERROR:
+            if json_output :
+                print_json({"error" : "Error while login"})
+            else:
+                print(f"Error while loging: {res}")
+        else: # should probably wait for the good ack
+            timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
+            res = await mc.wait_for_event(EventType.LOGIN_SUCCESS, timeout=timeout)
+            logger.debug(res)
+            if res is None:
+                print("Login failed : Timeout waiting response")
+            elif json_output :
+                if res.type == EventType.LOGIN_SUCCESS:
+                    print_json({"login_success" : True})
                 else:
-                    end="\n"
-                while ret:
-                    res = await mc.commands.get_msg()
-                    logger.debug(res)
-                    if res.type != EventType.NO_MORE_MSGS:
-                        if not first and json_output :
-                            print(",")
-                    ret = await process_event_message(mc, res, json_output,end=end)
-                    first = False
-                if json_output :
-                    print("]")
-
-            case "infos" | "i" :
-                await mc.commands.send_appstart()
-                print(json.dumps(mc.self_info,indent=4))
-
-            case "advert" | "a":
-                res = await mc.commands.send_advert()
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error sending advert: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
+                    print_json({"login_success" : False, "error" : "login failed"})
+            else:
+                if res.type == EventType.LOGIN_SUCCESS:
+                    print("Login success")
                 else:
-                    print("Advert sent")
-
-            case "flood_advert" | "floodadv":
-                res = await mc.commands.send_advert(flood=True)
-                logger.debug(res)
-                if res.type == EventType.ERROR:
-                    print(f"Error sending advert: {res}")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
+                    print("Login failed")
+    return 2
+
+def contact_command(method, err, ok=None, done=None):
+    """ builds a handler calling mc.commands.<method> on the contact named in
+        cmds[1], done(mc, contact) is then called if it succeeded """
+    async def handler(mc, cmds, json_output):
+        contact = await resolve_contact(mc, cmds[1], json_output)
+        if not contact is None:
+            res = await getattr(mc.commands, method)(contact)
+            logger.debug(res)
+            if print_result(res, json_output, err, ok) and not done is None :
+                done(mc, contact)
+        return 1
+    return handler
+
+def path_reset(mc, contact):
+    contact["out_path"] = ""
+    contact["out_path_len"] = -1
+
+def contact_removed(mc, contact):
+    del mc.contacts[contact["public_key"]]
+    contacts_changed()
+
+do_logout = contact_command("send_logout", "Error while logout", ok="Logout ok")
+
+async def do_contact_timeout(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 2
+    contact["timeout"] = float(cmds[2])
+    return 2
+
+async def do_req_status(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    res = await mc.commands.send_statusreq(contact)
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        print(f"Error while requesting status: {res}")
+    else :
+        timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
+        res = await mc.wait_for_event(EventType.STATUS_RESPONSE, timeout=timeout)
+        logger.debug(res)
+        if res is None:
+            if json_output :
+                print_json({"error" : "Timeout waiting status"})
+            else:
+                print("Timeout waiting status")
+        else :
+            print_json(res.payload, indent=True)
+    return 1
+
+async def do_req_telemetry(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    res = await mc.commands.send_telemetry_req(contact)
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        print(f"Error while requesting telemetry")
+    else:
+        timeout = res.payload["suggested_timeout"]/800 if not "timeout" in contact or contact['timeout']==0 else contact["timeout"]
+        res = await mc.wait_for_event(EventType.TELEMETRY_RESPONSE, timeout=timeout)
+        logger.debug(res)
+        if res is None:
+            if json_output :
+                print_json({"error" : "Timeout waiting telemetry"})
+            else:
+                print("Timeout waiting telemetry")
+        else :
+            print_json(res.payload, indent=True)
+    return 1
+
+async def do_disc_path(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    res = await discover_path(mc, contact)
+    if res is None:
+        print(f"Error while discovering path")
+    else:
+        if json_output :
+            print_json(res)
+        else:
+            if "error" in res :
+                print("Timeout while discovering path")
+            else:
+                outp = res['out_path']
+                outp = outp if outp != "" else "direct"
+                inp = res['in_path']
+                inp = inp if inp != "" else "direct"
+                print(f"Path for {contact['adv_name']}: out {outp}, in {inp}")
+    return 1
+
+async def do_req_btelemetry(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    timeout = 0 if not "timeout" in contact else contact["timeout"]
+    res = await mc.commands.req_telemetry_sync(contact, timeout)
+    if res is None :
+        if json_output :
+            print_json({"error" : "Getting data"})
+        else:
+            print("Error getting data")
+    else :
+        print_json(res)
+    return 1
+
+async def do_req_bstatus(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    timeout = 0 if not "timeout" in contact else contact["timeout"]
+    res = await mc.commands.req_status_sync(contact, timeout)
+    if res is None :
+        if json_output :
+            print_json({"error" : "Getting data"})
+        else:
+            print("Error getting data")
+    else :
+        print_json(res, indent=True)
+    return 1
+
+async def do_req_mma(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 3
+    if cmds[2][-1] == "s":
+        from_secs = int(cmds[2][0:-1])
+    elif cmds[2][-1] == "m":
+        from_secs = int(cmds[2][0:-1]) * 60
+    elif cmds[2][-1] == "h":
+        from_secs = int(cmds[2][0:-1]) * 3600
+    else :
+        from_secs = int(cmds[2]) * 60 # same as tdeck
+    if cmds[3][-1] == "s":
+        to_secs = int(cmds[3][0:-1])
+    elif cmds[3][-1] == "m":
+        to_secs = int(cmds[3][0:-1]) * 60
+    elif cmds[3][-1] == "h":
+        to_secs = int(cmds[3][0:-1]) * 3600
+    else :
+        to_secs = int(cmds[3]) * 60
+    timeout = 0 if not "timeout" in contact else contact["timeout"]
+    res = await mc.commands.req_mma_sync(contact, from_secs, to_secs, timeout)
+    if res is None :
+        if json_output :
+            print_json({"error" : "Getting data"})
+        else:
+            print("Error getting data")
+    else :
+        print_json(res, indent=True)
+    return 3
+
+async def do_req_acl(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 1
+    timeout = 0 if not "timeout" in contact else contact["timeout"]
+    res = await mc.commands.req_acl_sync(contact, timeout)
+    if res is None :
+        if json_output :
+            print_json({"error" : "Getting data"})
+        else:
+            print("Error getting data")
+    else :
+        if json_output:
+            print_json(res)
+        else:
+            for e in res:
+                name = e['key']
+                ct = get_contact_by_key_prefix(mc, e['key'])
+                if ct is None:
+                    if mc.self_info["public_key"].startswith(e['key']):
+                        name = f"{'self':<20} [{e['key']}]"
                 else:
-                    print("Advert sent")
+                    name = f"{ct['adv_name']:<20} [{e['key']}]"
+                print(f"{name:{' '}<35}: {e['perm']:02x}")
+    return 1
+
+async def do_req_binary(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if contact is None:
+        return 2
+    timeout = 0 if not "timeout" in contact else contact["timeout"]
+    res = await mc.commands.req_binary(contact, bytes.fromhex(cmds[2]), timeout)
+    if res is None :
+        if json_output :
+            print_json({"error" : "Getting binary data"})
+        else:
+            print("Error getting binary data")
+    else :
+        print_json(res)
+    return 2
+
+async def do_contacts(mc, cmds, json_output):
+    await mc.ensure_contacts(follow=True)
+    res = mc.contacts
+    if json_output :
+        print_json(res)
+    else :
+        if res :
+            print("\n".join(c["adv_name"] for c in res.values()))
+        print(f"> {len(mc.contacts)} contacts in device")
+    return 0
+
+async def do_reload_contacts(mc, cmds, json_output):
+    await mc.commands.get_contacts()
+    res = mc.contacts
+    if json_output :
+        print_json(res)
+    else :
+        if res :
+            print("\n".join(c["adv_name"] for c in res.values()))
+        print(f"> {len(mc.contacts)} contacts in device")
+    return 0
+
+async def do_pending_contacts(mc, cmds, json_output):
+    if json_output:
+        print_json(mc.pending_contacts)
+    else:
+        for c in mc.pending_contacts.values():
+            print(f"{c['adv_name']}: {c['public_key']}")
+    return 0
+
+async def do_flush_pending(mc, cmds, json_output):
+    mc.flush_pending_contacts()
+    return 0
+
+async def do_add_pending(mc, cmds, json_output):
+    contact = mc.pop_pending_contact(cmds[1])
+    if contact is None:
+        if json_output:
+            print_json({"error":"Contact does not exist"})
+        else:
+            logger.error(f"Contact {cmds[1]} does not exist")
+    else:
+        res = await mc.commands.add_contact(contact)
+        logger.debug(res)
+        if res.type == EventType.ERROR:
+            print(f"Error adding contact: {res}")
+        else:
+            mc.contacts[contact["public_key"]]=contact
+            contacts_changed()
+            if json_output :
+                print_json(res.payload)
+    return 1
+
+async def do_path(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output, follow=True)
+    if not contact is None:
+        path = contact["out_path"]
+        path_len = contact["out_path_len"]
+        if json_output :
+            print_json({"adv_name" : contact["adv_name"],
+                        "out_path_len" : path_len,
+                        "out_path" : path})
+        else:
+            if (path_len == 0) :
+                print("0 hop")
+            elif (path_len == -1) :
+                print("Path not set")
+            else:
+                print(path)
+    return 1
+
+async def do_contact_info(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output, follow=True)
+    if not contact is None:
+        print_json(contact, indent=True)
+    return 1
+
+async def do_change_path(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if not contact is None:
+        path = cmds[2].replace(",","") # we'll accept path with ,
+        try:
+            res = await mc.commands.change_contact_path(contact, path)
+            logger.debug(res)
+            print_result(res, json_output, "Error setting path")
+        except ValueError:
+            print(f"Bad path format {cmds[2]}")
+    return 2
+
+async def do_change_flags(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if not contact is None:
+        res = await mc.commands.change_contact_flags(contact, int(cmds[2]))
+        logger.debug(res)
+        print_result(res, json_output, "Error setting path")
+    return 2
+
+do_reset_path = contact_command("reset_path", "Error resetting path", done=path_reset)
+
+do_share_contact = contact_command("share_contact", "Error while sharing contact")
+
+async def do_export_contact(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if not contact is None:
+        res = await mc.commands.export_contact(contact)
+        logger.debug(res)
+        if res.type == EventType.ERROR:
+            print(f"Error exporting contact: {res}")
+        else:
+            if json_output :
+                print_json(res.payload)
+            else :
+                print(res.payload['uri'])
+    return 1
 
-            case "sleep" | "s" :
-                argnum = 1
-                await asyncio.sleep(int(cmds[1]))
+async def do_import_contact(mc, cmds, json_output):
+    if cmds[1].startswith("meshcore://") :
+        res = await mc.commands.import_contact(bytes.fromhex(cmds[1][11:]))
+        logger.debug(res)
+        if res.type == EventType.ERROR:
+            print(f"Error while importing contact: {res}")
+        else:
+            logger.info("Contact successfully added")
+            await mc.commands.get_contacts()
+    return 1
+
+def upload_uri(uri):
+    """ posts a contact uri to the map, reusing the same http session """
+    if upload_uri.session is None :
+        import requests # only needed here, slow to import
+        upload_uri.session = requests.Session()
+    return upload_uri.session.post(MAP_NODES_URL, json = {"links": [uri]})
+upload_uri.session = None
+
+async def do_upload_contact(mc, cmds, json_output):
+    contact = await resolve_contact(mc, cmds[1], json_output)
+    if not contact is None:
+        res = await mc.commands.export_contact(contact)
+        logger.debug(res)
+        if res.type == EventType.ERROR:
+            print(f"Error exporting contact: {res}")
+        else :
+            resp = upload_uri(res.payload['uri'])
+            if json_output :
+                print_json({"response" : str(resp)})
+            else :
+                print(resp)
+    return 1
 
-            case "wait_key" | "wk" :
-                try :
-                    ps = PromptSession()
-                    if json_output:
-                        await ps.prompt_async()
-                    else:
-                        await ps.prompt_async("Press Enter to continue ...")
-                except (EOFError, KeyboardInterrupt, asyncio.CancelledError):
-                    pass
-
-            case "wait_msg" | "wm" :
-                ev = await mc.wait_for_event(EventType.MESSAGES_WAITING)
-                if ev is None:
-                    print("Timeout waiting msg")
-                else:
-                    res = await mc.commands.get_msg()
-                    logger.debug(res)
-                    await process_event_message(mc, res, json_output)
-
-            case "trywait_msg" | "wmt" :
-                argnum = 1
-                if await mc.wait_for_event(EventType.MESSAGES_WAITING, timeout=int(cmds[1])) :
-                    res = await mc.commands.get_msg()
-                    logger.debug(res)
-                    await process_event_message(mc, res, json_output)
-
-            case "wmt8"|"]":
-                if await mc.wait_for_event(EventType.MESSAGES_WAITING, timeout=8) :
-                    res = await mc.commands.get_msg()
-                    logger.debug(res)
-                    await process_event_message(mc, res, json_output)
-
-            case "wait_ack" | "wa" | "}":
-                res = await mc.wait_for_event(EventType.ACK, timeout = 5)
-                logger.debug(res)
-                if res is None:
-                    if json_output :
-                        print(json.dumps({"error" : "Timeout waiting ack"}))
-                    else:
-                        print("Timeout waiting ack")
-                elif json_output :
-                    print(json.dumps(res.payload, indent=4))
-                else :
-                    print("Msg acked")
+async def do_card(mc, cmds, json_output):
+    res = await mc.commands.export_contact()
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        print(f"Error exporting contact: {res}")
+    elif json_output :
+        print_json(res.payload)
+    else :
+        print(res.payload['uri'])
+    return 0
 
-            case "msgs_subscribe" | "ms" :
-                await subscribe_to_msgs(mc, json_output=json_output)
+async def do_upload_card(mc, cmds, json_output):
+    res = await mc.commands.export_contact()
+    logger.debug(res)
+    if res.type == EventType.ERROR:
+        print(f"Error exporting contact: {res}")
+    else :
+        resp = upload_uri(res.payload['uri'])
+        if json_output :
+            print_json({"response" : str(resp)})
+        else :
+            print(resp)
+    return 0
+
+do_remove_contact = contact_command("remove_contact", "Error removing contact", done=contact_removed)
+
+async def do_recv(mc, cmds, json_output):
+    res = await mc.commands.get_msg()
+    logger.debug(res)
+    await process_event_message(mc, res, json_output)
+    return 0
+
+async def do_sync_msgs(mc, cmds, json_output):
+    get_msg = mc.commands.get_msg # bound once, called for each msg
+    if json_output : # gather all messages and dump them at once
+        msgs = []
+        stop_types = (EventType.NO_MORE_MSGS, EventType.ERROR)
+        while True:
+            res = await get_msg()
+            logger.debug(res)
+            if res is None or res.type in stop_types:
+                await process_event_message(mc, res, json_output) # logs why we stop
+                break
+            msgs.append(res.payload)
+        print_json(msgs)
+        return 0
+
+    out = [] # messages are written in one go once synced
+    ret = True
+    while ret:
+        res = await get_msg()
+        logger.debug(res)
+        ret = await process_event_message(mc, res, json_output, out=out)
+    if out :
+        print("\n".join(out), flush=True)
+    return 0
+
+async def do_infos(mc, cmds, json_output):
+    await ensure_self_info(mc)
+    print_json(mc.self_info, indent=True)
+    return 0
+
+async def do_advert(mc, cmds, json_output):
+    ensure_self_info.fresh_until = 0 # node may update its location when advertising
+    res = await mc.commands.send_advert()
+    logger.debug(res)
+    print_result(res, json_output, "Error sending advert", ok="Advert sent")
+    return 0
+
+async def do_flood_advert(mc, cmds, json_output):
+    ensure_self_info.fresh_until = 0 # node may update its location when advertising
+    res = await mc.commands.send_advert(flood=True)
+    logger.debug(res)
+    print_result(res, json_output, "Error sending advert", ok="Advert sent")
+    return 0
+
+async def do_sleep(mc, cmds, json_output):
+    await asyncio.sleep(int(cmds[1]))
+    return 1
+
+async def do_wait_key(mc, cmds, json_output):
+    try :
+        if do_wait_key.session is None :
+            do_wait_key.session = PromptSession()
+        if json_output:
+            await do_wait_key.session.prompt_async()
+        else:
+            await do_wait_key.session.prompt_async("Press Enter to continue ...")
+    except (EOFError, KeyboardInterrupt, asyncio.CancelledError):
+        pass
+    return 0
+do_wait_key.session = None
+
+async def do_wait_msg(mc, cmds, json_output):
+    ev = await mc.wait_for_event(EventType.MESSAGES_WAITING)
+    if ev is None:
+        print("Timeout waiting msg")
+    else:
+        res = await mc.commands.get_msg()
+        logger.debug(res)
+        await process_event_message(mc, res, json_output)
+    return 0
+
+async def do_trywait_msg(mc, cmds, json_output):
+    if await mc.wait_for_event(EventType.MESSAGES_WAITING, timeout=int(cmds[1])) :
+        res = await mc.commands.get_msg()
+        logger.debug(res)
+        await process_event_message(mc, res, json_output)
+    return 1
+
+async def do_wmt8(mc, cmds, json_output):
+    if await mc.wait_for_event(EventType.MESSAGES_WAITING, timeout=8) :
+        res = await mc.commands.get_msg()
+        logger.debug(res)
+        await process_event_message(mc, res, json_output)
+    return 0
+
+async def do_wait_ack(mc, cmds, json_output):
+    res = await mc.wait_for_event(EventType.ACK, timeout = 5)
+    logger.debug(res)
+    if res is None:
+        if json_output :
+            print_json({"error" : "Timeout waiting ack"})
+        else:
+            print("Timeout waiting ack")
+    elif json_output :
+        print_json(res.payload)
+    else :
+        print("Msg acked")
+    return 0
 
-            case "interactive" | "im" | "chat" :
-                await interactive_loop(mc)
+async def do_msgs_subscribe(mc, cmds, json_output):
+    await subscribe_to_msgs(mc, json_output=json_output)
+    return 0
 
-            case "chat_to" | "imto" | "to" :
-                argnum = 1
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[1])
-                await interactive_loop(mc, to=contact)
+async def do_interactive(mc, cmds, json_output):
+    await interactive_loop(mc)
+    return 0
 
-            case "script" :
-                argnum = 1
-                await process_script(mc, cmds[1], json_output=json_output)
+async def do_chat_to(mc, cmds, json_output):
+    await mc.ensure_contacts()
+    contact = get_contact_by_name(mc, cmds[1])
+    await interactive_loop(mc, to=contact)
+    return 1
 
-            case _ :
-                await mc.ensure_contacts()
-                contact = mc.get_contact_by_name(cmds[0])
-                if contact is None:
-                    logger.error(f"Unknown command : {cmd}, will exit ...")
-                    return None
+async def do_script(mc, cmds, json_output):
+    await process_script(mc, cmds[1], json_output=json_output)
+    return 1
 
-                await interactive_loop(mc, to=contact)
+async def do_default(mc, cmds, json_output):
+    await mc.ensure_contacts()
+    contact = get_contact_by_name(mc, cmds[0])
+    if contact is None:
+        logger.error(f"Unknown command : {cmds[0]}, will exit ...")
+        return None
+
+    await interactive_loop(mc, to=contact)
+    return 0
+
+
+# aliases of each command handler, COMMANDS is built from it
+COMMAND_ALIASES = [
+    (("help",), do_help),
+    (("ver", "query", "v", "q"), do_ver),
+    (("clock",), do_clock),
+    (("sync_time", "clock sync", "st"), do_sync_time),
+    (("time",), do_time),
+    (("set",), do_set),
+    (("get",), do_get),
+    (("self_telemetry", "t"), do_self_telemetry),
+    (("get_channel",), do_get_channel),
+    (("get_channels", "gc"), do_get_channels),
+    (("set_channel",), do_set_channel),
+    (("remove_channel",), do_remove_channel),
+    (("reboot",), do_reboot),
+    (("msg", "m", "{"), do_msg),
+    (("chan", "ch"), do_chan),
+    (("public", "dch"), do_public),
+    (("cmd", "c", "["), do_cmd),
+    (("trace", "tr"), do_trace),
+    (("login", "l"), do_login),
+    (("logout",), do_logout),
+    (("contact_timeout",), do_contact_timeout),
+    (("req_status", "rs"), do_req_status),
+    (("req_telemetry", "rt"), do_req_telemetry),
+    (("disc_path", "dp"), do_disc_path),
+    (("req_btelemetry", "rbt"), do_req_btelemetry),
+    (("req_bstatus", "rbs"), do_req_bstatus),
+    (("req_mma", "rm"), do_req_mma),
+    (("req_acl",), do_req_acl),
+    (("req_binary",), do_req_binary),
+    (("contacts", "list", "lc"), do_contacts),
+    (("reload_contacts", "rc"), do_reload_contacts),
+    (("pending_contacts",), do_pending_contacts),
+    (("flush_pending",), do_flush_pending),
+    (("add_pending",), do_add_pending),
+    (("path",), do_path),
+    (("contact_info", "ci"), do_contact_info),
+    (("change_path", "cp"), do_change_path),
+    (("change_flags", "cf"), do_change_flags),
+    (("reset_path", "rp"), do_reset_path),
+    (("share_contact", "sc"), do_share_contact),
+    (("export_contact", "ec"), do_export_contact),
+    (("import_contact", "ic"), do_import_contact),
+    (("upload_contact", "uc"), do_upload_contact),
+    (("card",), do_card),
+    (("upload_card",), do_upload_card),
+    (("remove_contact",), do_remove_contact),
+    (("recv", "r"), do_recv),
+    (("sync_msgs", "sm"), do_sync_msgs),
+    (("infos", "i"), do_infos),
+    (("advert", "a"), do_advert),
+    (("flood_advert", "floodadv"), do_flood_advert),
+    (("sleep", "s"), do_sleep),
+    (("wait_key", "wk"), do_wait_key),
+    (("wait_msg", "wm"), do_wait_msg),
+    (("trywait_msg", "wmt"), do_trywait_msg),
+    (("wmt8", "]"), do_wmt8),
+    (("wait_ack", "wa", "}"), do_wait_ack),
+    (("msgs_subscribe", "ms"), do_msgs_subscribe),
+    (("interactive", "im", "chat"), do_interactive),
+    (("chat_to", "imto", "to"), do_chat_to),
+    (("script",), do_script),
+]
+COMMANDS = {alias : handler for aliases, handler in COMMAND_ALIASES for alias in aliases}
+
+async def next_cmd(mc, cmds, json_output=False):
+    """ process next command """
+    try :
+        if cmds[0].startswith(".") : # override json_output
+            json_output = True
+            cmd = cmds[0][1:]
+        else:
+            cmd = cmds[0]
 
-        logger.debug(f"cmd {cmds[0:argnum+1]} processed ...")
+        argnum = await COMMANDS.get(cmd, do_default)(mc, cmds, json_output)
+        if argnum is None:
+            return None
+
+        if logger.isEnabledFor(logging.DEBUG) : # avoid slicing cmds for nothing
+            logger.debug("cmd %s processed ...", cmds[0:argnum+1])
         return cmds[argnum+1:]
 
     except IndexError:
@@ -2426,25 +2439,25 @@ async def next_cmd(mc, cmds, json_output=False):
 
 async def process_cmds (mc, args, json_output=False) :
     cmds = args
-    while cmds and len(cmds) > 0 and cmds[0][0] != '#' :
+    while cmds and cmds[0] and cmds[0][0] != '#' :
         cmds = await next_cmd(mc, cmds, json_output)
 
 async def process_script(mc, file, json_output=False):
-    if not os.path.exists(file) :
+    try :
+        f = open(file, "r")
+    except (FileNotFoundError, NotADirectoryError) :
         logger.info(f"file {file} not found")
         if json_output :
-            print(json.dumps({"error" : f"file {file} not found"}))
+            print_json({"error" : f"file {file} not found"})
         return
 
-    with open(file, "r") as f :
-        lines=f.readlines()
-
-    for line in lines:
-        line = line.strip()
-        if not (line == "" or line[0] == "#"):
-            logger.debug(f"processing {line}")
-            cmds = shlex.split(line)
-            await process_cmds(mc, cmds, json_output)
+    with f :
+        for line in f :
+            line = line.strip()
+            if not (line == "" or line[0] == "#"):
+                logger.debug("processing %s", line)
+                cmds = split_args(line)
+                await process_cmds(mc, cmds, json_output)
 
 def version():
     print (f"meshcore-cli: command line interface to MeshCore companion radios {VERSION}")
@@ -2535,6 +2548,12 @@ def usage () :
  Available Commands and shorcuts (can be chained) :""")
     command_help()
 
+async def scan_devices(timeout):
+    """ ble devices and serial ports, serial ports are listed during the ble scan """
+    import serial.tools.list_ports
+    return await asyncio.gather(BleakScanner.discover(timeout=timeout),
+                asyncio.to_thread(serial.tools.list_ports.comports))
+
 async def main(argv):
     """ Do the job """
     json_output = JSON
@@ -2547,11 +2566,14 @@ async def main(argv):
     baudrate = 115200
     timeout = 2
     pin = None
+    has_config_dir = os.path.isdir(MCCLI_CONFIG_DIR)
     # If there is an address in config file, use it by default
     # unless an arg is explicitely given
-    if os.path.exists(MCCLI_ADDRESS) :
+    try :
         with open(MCCLI_ADDRESS, encoding="utf-8") as f :
             address = f.readline().strip()
+    except (FileNotFoundError, NotADirectoryError) :
+        pass
 
     opts, args = getopt.getopt(argv, "a:d:s:ht:p:b:jDhvSlT:P")
     for opt, arg in opts :
@@ -2584,26 +2606,24 @@ async def main(argv):
                 version()
                 return
             case "-l" :
+                devices, ports = await scan_devices(timeout)
                 print("BLE devices:")
-                devices = await BleakScanner.discover(timeout=timeout)
                 if len(devices) == 0:
                     print(" No ble device found")
                 for d in devices :
                     if not d.name is None and d.name.startswith("MeshCore-"):
                         print(f" {d.address}  {d.name}")
                 print("\nSerial ports:")
-                ports = serial.tools.list_ports.comports()
                 for port, desc, hwid in sorted(ports):
                     print(f" {port:<18} {desc} [{hwid}]")
                 return
             case "-S" :
-                devices = await BleakScanner.discover(timeout=timeout)
+                devices, ports = await scan_devices(timeout)
                 choices = []
                 for d in devices:
                     if not d.name is None and d.name.startswith("MeshCore-"):
                         choices.append(({"type":"ble","device":d}, f"{d.address:<22} {d.name}"))
 
-                ports = serial.tools.list_ports.comports()
                 for port, desc, hwid in sorted(ports):
                     choices.append(({"type":"serial","port":port}, f"{port:<22} {desc}"))
                 if len(choices) == 0:
@@ -2677,13 +2697,15 @@ async def main(argv):
                 return
 
 
-        # Store device address in configuration
-        if os.path.isdir(MCCLI_CONFIG_DIR) :
+        # Store device address in configuration (if config dir exists and is writable)
+        try :
             with open(MCCLI_ADDRESS, "w", encoding="utf-8") as f :
                 if not device is None:
                     f.write(device.address)
                 elif not address is None:
                     f.write(address)
+        except OSError :
+            pass
 
     handle_message.mc = mc # connect meshcore to handle_message
     handle_advert.mc = mc
@@ -2692,6 +2714,7 @@ async def main(argv):
     mc.subscribe(EventType.ADVERTISEMENT, handle_advert)
     mc.subscribe(EventType.PATH_UPDATE, handle_path_update)
     mc.subscribe(EventType.NEW_CONTACT, handle_new_contact)
+    mc.subscribe(EventType.CONTACTS, handle_contacts)
 
     mc.auto_update_contacts = True
 
@@ -2700,19 +2723,17 @@ async def main(argv):
         logger.error(f"Error while querying device: {res}")
         return
 
-    if os.path.isdir(MCCLI_CONFIG_DIR) :
+    if has_config_dir :
         log_message.file = MCCLI_CONFIG_DIR + mc.self_info["name"] + ".msgs"
 
-    if (json_output) :
-        logger.setLevel(logging.ERROR)
-    else :
+    if not json_output :
         if res.payload["fw ver"] > 2 :
             logger.info(f"Connected to {mc.self_info['name']} running on a {res.payload['ver']} fw.")
         else :
             logger.info(f"Connected to {mc.self_info['name']}.")
 
     if os.path.exists(MCCLI_INIT_SCRIPT) and not json_output :
-        logger.debug(f"Executing init script : {MCCLI_INIT_SCRIPT}")
+        logger.debug("Executing init script : %s", MCCLI_INIT_SCRIPT)
         await process_script(mc, MCCLI_INIT_SCRIPT, json_output)
 
     device_init_script = MCCLI_CONFIG_DIR + mc.self_info["name"] + ".init"
@@ -2720,7 +2741,7 @@ async def main(argv):
         logger.info(f"Executing device init script : {device_init_script}")
         await process_script(mc, device_init_script, json_output)
     else:
-        logger.debug(f"No device init script for {mc.self_info['name']}")
+        logger.debug("No device init script for %s", mc.self_info['name'])
 
     if len(args) == 0 : # no args, run in chat mode
         await process_cmds(mc, ["chat"], json_output)
@@ -2728,14 +2749,25 @@ async def main(argv):
         await process_cmds(mc, args, json_output)
 
 def cli():
+    run_args = {}
+    try: # use uvloop when it is installed, it has a faster event loop
+        import uvloop
+        if sys.version_info >= (3, 12) : # loop policies are deprecated in 3.14
+            run_args["loop_factory"] = uvloop.new_event_loop
+        else :
+            asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+
     try:
-        asyncio.run(main(sys.argv[1:]))
+        asyncio.run(main(sys.argv[1:]), **run_args)
     except KeyboardInterrupt:
         # This prevents the KeyboardInterrupt traceback from being shown
         print("\nExited cleanly")
     except Exception as e:
-        print(f"Error: {e}")
+        print(f"Error: {e}", file=sys.stderr)
         traceback.print_exc()
+        sys.exit(1)
 
 if __name__ == '__main__':
     cli()
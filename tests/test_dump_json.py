@@ -0,0 +1,47 @@
+import unittest
+
+import meshcore_cli.meshcore_cli as mccli
+
+class DumpJsonTest(unittest.TestCase):
+
+    SAMPLES = [
+        {"text" : "héllo ☃", "name" : "node"},
+        {"expected_ack" : b"\x01\xab", "suggested_timeout" : 3000},
+        {1 : "int key", "list" : [1, 2.5, None, True]},
+    ]
+
+    def dump_without_orjson(self, obj):
+        orjson = mccli.orjson
+        mccli.orjson = None
+        try :
+            return mccli.dump_json(obj)
+        finally :
+            mccli.orjson = orjson
+
+    def test_stdlib_output(self):
+        self.assertEqual(self.dump_without_orjson(self.SAMPLES[0]),
+            '{"text":"héllo ☃","name":"node"}')
+        self.assertEqual(self.dump_without_orjson(self.SAMPLES[1]),
+            '{"expected_ack":"01ab","suggested_timeout":3000}')
+
+    def test_output_format(self):
+        # -j output : one compact line, utf-8 kept, bytes as hex
+        for dump in (mccli.dump_json, self.dump_without_orjson) :
+            self.assertEqual(dump({"time" : 1744957261}), '{"time":1744957261}')
+            self.assertEqual(dump(self.SAMPLES[0]), '{"text":"héllo ☃","name":"node"}')
+            self.assertEqual(dump(self.SAMPLES[1]),
+                '{"expected_ack":"01ab","suggested_timeout":3000}')
+            self.assertEqual(dump(self.SAMPLES[2]),
+                '{"1":"int key","list":[1,2.5,null,true]}')
+
+    def test_indented_format(self):
+        self.assertEqual(mccli.dump_json({"time" : 1744957261, "ack" : b"\x01"}, indent=True),
+            '{\n    "time": 1744957261,\n    "ack": "01"\n}')
+
+    @unittest.skipIf(mccli.orjson is None, "orjson not installed")
+    def test_same_output_with_orjson(self):
+        for obj in self.SAMPLES :
+            self.assertEqual(mccli.dump_json(obj), self.dump_without_orjson(obj))
+
+if __name__ == "__main__":
+    unittest.main()